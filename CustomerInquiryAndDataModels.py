@@ -1,14 +1,34 @@
 from datetime import datetime
 from enum import Enum, auto
-import sqlite3
 import json
-from email_validator import validate_email, EmailNotValidError
+import threading
+import atexit
+from connection_pool import ConnectionPool
+from migrations import configure_connection, connect, database_path, migrate
+from catalog_cache import (
+    restaurant_catalog, restaurant_tag, location_tag, invalidate_catalog, add_invalidation_listener,
+    sync_restaurant_changes,
+)
+from spatial_index import RestaurantSpatialIndex
+from ranking import RestaurantRanking
+from location_buffer import CustomerLocationBuffer
+from opening_hours import OpeningHoursIndex, parse_open_at
+from availability_snapshot import AvailabilityMaterializer, AvailabilitySnapshotReader, default_snapshot_directory
+from user_cache import invalidate_user, normalize_email, user_catalog, user_tag
+from restaurant_index import fetch_in_chunks
+import instrumentation
 
 
 ########################################
 ############Data Modeling###############
 ########################################
+def decode_locations(location_json: str) -> set[str]:
+    return set(json.loads(location_json)) if location_json else set()
+
+
 class User:
+    __slots__ = ("email", "password", "id", "name", "mobile_number", "last_used_at", "_location", "_location_json")
+
     def __init__(
             self,
             user_id: int,
@@ -25,10 +45,36 @@ class User:
         self.name = name
         self.mobile_number = mobile_number
         self.last_used_at = last_used_at
-        self.location = location
+        self._location = location
+        self._location_json = None
+
+    @classmethod
+    def from_row(cls, user_row: tuple):
+        # LOCATION stays JSON until it is read
+        user = cls.__new__(cls)
+        (user.id, user.name, user.email, user.password,
+         user.mobile_number, user.last_used_at, user._location_json) = user_row[:7]
+        user._location = None
+        return user
+
+    @property
+    def location(self) -> set[str]:
+        if self._location is None:
+            self._location = decode_locations(self._location_json)
+        return self._location
+
+    @location.setter
+    def location(self, location: set[str]):
+        self._location = location
 
 
 class Restaurant:
+    __slots__ = (
+        "id", "name", "_location", "_location_json", "num_of_bags",
+        "remaining_bags", "overall_rating", "opening_time", "closing_time",
+        "latitude", "longitude"
+    )
+
     def __init__(
             self,
             restaurant_id: int,
@@ -38,16 +84,42 @@ class Restaurant:
             remaining_bags: int,
             overall_rating: float,
             opening_time: datetime,
-            closing_time: datetime
+            closing_time: datetime,
+            latitude: float = None,
+            longitude: float = None
     ):
         self.id = restaurant_id
         self.name = name
-        self.location = location
+        self._location = location
+        self._location_json = None
         self.num_of_bags = num_of_bags
         self.remaining_bags = remaining_bags
         self.overall_rating = overall_rating
         self.opening_time = opening_time
         self.closing_time = closing_time
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def from_row(cls, restaurant_row: tuple):
+        # LOCATION stays JSON until it is read, most callers only need name and bags
+        restaurant = cls.__new__(cls)
+        (restaurant.id, restaurant.name, restaurant._location_json, restaurant.num_of_bags,
+         restaurant.remaining_bags, restaurant.overall_rating, restaurant.opening_time,
+         restaurant.closing_time) = restaurant_row[:8]
+        restaurant.latitude, restaurant.longitude = restaurant_row[8:10] if len(restaurant_row) >= 10 else (None, None)
+        restaurant._location = None
+        return restaurant
+
+    @property
+    def location(self) -> set[str]:
+        if self._location is None:
+            self._location = decode_locations(self._location_json)
+        return self._location
+
+    @location.setter
+    def location(self, location: set[str]):
+        self._location = location
 
 
 class PurchaseStatus(Enum):
@@ -57,6 +129,8 @@ class PurchaseStatus(Enum):
 
 
 class PurchaseOrder:
+    __slots__ = ("id", "user_id", "location", "restaurant_id", "num_of_bags", "ordered_at", "status")
+
     def __init__(self,
                  purchase_order_id: int,
                  user_id: int,
@@ -73,8 +147,16 @@ class PurchaseOrder:
         self.ordered_at = ordered_at
         self.status = status
 
+    @classmethod
+    def from_row(cls, purchase_order_row: tuple):
+        # Column order of PURCHASE_ORDER
+        purchase_order_id, user_id, restaurant_id, num_of_bags, location, ordered_at, status = purchase_order_row[:7]
+        return cls(purchase_order_id, user_id, location, restaurant_id, num_of_bags, ordered_at, PurchaseStatus(status))
+
 
 class UserRating:
+    __slots__ = ("id", "user_id", "restaurant_id", "rating")
+
     def __init__(
             self,
             id: int,
@@ -88,97 +170,124 @@ class UserRating:
         self.rating = rating
 
 
+def user_row_factory(cursor, row):
+    return User.from_row(row)
+
+
+def restaurant_row_factory(cursor, row):
+    return Restaurant.from_row(row)
+
+
+def purchase_order_row_factory(cursor, row):
+    return PurchaseOrder.from_row(row)
+
+
+def mapped_cursor(cursor, row_factory):
+    # A sibling cursor on the same connection whose rows come back as model objects
+    mapped = cursor.connection.cursor()
+    mapped.row_factory = row_factory
+    return mapped
+
+
 ##############################################
 ##############################################
 ##############################################
 
+default_pool_size = 5
+
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+
 def initialize_db():
-    conn = sqlite3.connect('app_backend.db')
-    cursor = conn.cursor()
+    return connect(database_path).cursor()
+
+
+def create_schema(cursor):
+    migrate(cursor)
 
-    # Create User table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS USER (
-    USER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-    NAME TEXT NOT NULL,
-    EMAIL TEXT NOT NULL,
-    PASSWORD TEXT NOT NULL,
-    MOBILE_NUMBER INTEGER NOT NULL,
-    LAST_USED_AT TIMESTAMP NOT NULL,
-    LOCATION TEXT)
-    """)
-
-    # Create Restaurant table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS RESTAURANT (
-    RESTAURANT_ID INTEGER NOT NULL,
-    NAME TEXT NOT NULL,
-    LOCATION TEXT NOT NULL,
-    NUM_OF_BAGS INTEGER NOT NULL,
-    REMAINING_BAGS INTEGER NOT NULL,
-    OVERALL_RATING FLOAT,
-    OPENING_TIME TIMESTAMP NOT NULL,
-    CLOSING_TIME TIMESTAMP NOT NULL)
-    """)
-
-    # Create Purchase order table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS PURCHASE_ORDER (
-    PURCHASE_ORDER_ID INTEGER NOT NULL,
-    USER_ID INTEGER NOT NULL,
-    RESTAURANT_ID INTEGER NOT NULL,
-    NUM_OF_BAGS INTEGER NOT NULL,
-    LOCATION TEXT NOT NULL,
-    ORDERD_AT TIMESTAMP NOT NULL,
-    STATUS INTEGER NOT NULL)
-    """)
-
-    # Create User Rating table
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS USER_RATING (
-    ID INTEGER NOT NULL,
-    USER_ID INTEGER NOT NULL,
-    RESTAURANT_ID INTEGER NOT NULL,
-    RATING FLOAT NOT NULL)
-    """)
-    return cursor
+
+def _on_connect(conn):
+    configure_connection(conn)
+    instrumentation.attach_connection(conn)
+
+
+def configure_connection_pool(size: int = default_pool_size, database: str = None):
+    global _connection_pool
+    with _connection_pool_lock:
+        if _connection_pool is not None:
+            # Buffered locations belong to the old database
+            customer_location_buffer.flush()
+            _connection_pool.close()
+        customer_location_buffer.clear_recent()
+        invalidate_catalog()
+        invalidate_user()
+        _connection_pool = ConnectionPool(
+            database or database_path, size, initializer=create_schema, on_connect=_on_connect
+        )
+        return _connection_pool
+
+
+def get_connection_pool() -> ConnectionPool:
+    global _connection_pool
+    if _connection_pool is None:
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                _connection_pool = ConnectionPool(
+                    database_path, default_pool_size, initializer=create_schema,
+                    on_connect=_on_connect
+                )
+    return _connection_pool
 
 
 simplex_rating_threshold = 2.5
 default_num_of_restaurants = 5
 
+# Nearest restaurants lookups, refreshed incrementally on every restaurant write
+restaurant_spatial_index = RestaurantSpatialIndex()
+add_invalidation_listener(restaurant_spatial_index.invalidate)
+
+# Per location top restaurants, re-ranked only for the restaurants written since the last inquiry
+restaurant_ranking = RestaurantRanking()
+add_invalidation_listener(restaurant_ranking.invalidate)
+
+# Which restaurants are open at a given minute, per location, without parsing hours per row
+opening_hours_index = OpeningHoursIndex()
+add_invalidation_listener(opening_hours_index.invalidate)
+
+# New customer locations are written behind the inquiry, in batches
+customer_location_buffer = CustomerLocationBuffer(lambda: get_connection_pool().cursor())
+atexit.register(customer_location_buffer.close)
+
+# Per location simplex responses written to disk after bag changes, off until availability_materializer.enable()
+availability_materializer = AvailabilityMaterializer(
+    lambda: get_connection_pool().cursor(), lambda cursor, location: simplex_response(cursor, location)
+)
+add_invalidation_listener(availability_materializer.invalidate)
+atexit.register(availability_materializer.close)
+# Set by serve_availability_snapshots(), simplex inquiries then come from the mapped snapshot files
+availability_reader = None
+
+
+def serve_availability_snapshots(directory: str = default_snapshot_directory):
+    global availability_reader
+    availability_reader = AvailabilitySnapshotReader(directory) if directory is not None else None
+    return availability_reader
+
 
 def map_user(user_row: tuple):
-    print("user-row ", user_row)
-    return User(
-        user_row[0],
-        user_row[1],
-        user_row[2],
-        user_row[3],
-        user_row[4],
-        user_row[5],
-        set(json.loads(user_row[6])) if user_row[6] else set()
-    )
+    with instrumentation.stage("row_mapping"):
+        return User.from_row(user_row)
 
 
 def map_restaurants(restaurant_rows: tuple):
-    restaurants = []
-    for restaurant_row in restaurant_rows:
-        restaurant_object = Restaurant(
-            restaurant_row[0],
-            restaurant_row[1],
-            set(json.loads(restaurant_row[2])) if restaurant_row[2] else set(),
-            restaurant_row[3],
-            restaurant_row[4],
-            restaurant_row[5],
-            restaurant_row[6],
-            restaurant_row[7]
-        )
-        restaurants.append(restaurant_object)
-    return restaurants
+    with instrumentation.stage("row_mapping"):
+        return [Restaurant.from_row(restaurant_row) for restaurant_row in restaurant_rows]
 
 
 class RestaurantResponse:
+    __slots__ = ("name", "num_of_bags")
+
     def __init__(self,
                  name: str,
                  num_of_bags: int):
@@ -192,69 +301,261 @@ class RestaurantResponse:
         }
 
 
-def validate_inputs(cursor, data: dict, required_fields: list):
+def get_restaurant(cursor, restaurant_id: int):
+    key = ("restaurant", restaurant_id)
+    restaurant = restaurant_catalog.get(key)
+    if restaurant is None:
+        restaurant = mapped_cursor(cursor, restaurant_row_factory).execute(
+            "SELECT * FROM RESTAURANT WHERE RESTAURANT_ID = ? LIMIT 1", (restaurant_id,)
+        ).fetchone()
+        if restaurant is None:
+            return None
+        restaurant_catalog.put(key, restaurant, [restaurant_tag(restaurant_id)])
+    return restaurant
+
+
+def restaurant_exists(cursor, restaurant_id: int) -> bool:
+    return get_restaurant(cursor, restaurant_id) is not None
+
+
+def validate_input_types(data: dict, required_fields: list):
+    # The checks needing no database, sharded requests run them before a field is used to pick the shard
+    if not isinstance(data, dict):
+        raise ValueError("Request must be an object")
+
     for field in required_fields:
         if field not in data:
             raise ValueError(f"Missing required field: {field}")
 
-    if "numberOfBags" in data and data["numberOfBags"] <= 0:
+    # Fields used as keys, SQL parameters or compared must have their type before anything else looks at them
+    for field in ("email", "location", "selectionStrategy"):
+        if field in data and not isinstance(data[field], str):
+            raise ValueError(f"{field} must be a string")
+
+    for field in ("restaurantId", "purchaseOrderId"):
+        if field in data and not isinstance(data[field], int):
+            raise ValueError(f"{field} must be an integer")
+
+    if "emailOrPhone" in data and not isinstance(data["emailOrPhone"], (str, int)):
+        raise ValueError("emailOrPhone must be an email or a phone number")
+
+    if "numberOfBags" in data and not (isinstance(data["numberOfBags"], int) and data["numberOfBags"] > 0):
         raise ValueError("numberOfBags must be > 0")
 
-    # check if this statement makes sense
-    restaurants = map_restaurants(cursor.execute("SELECT * FROM RESTAURANT").fetchall())
-    restaurant = next((r for r in restaurants if "restaurantId" in data and r.id == data["restaurantId"]), None)
-    if restaurant is None and "restaurantId" in data:
+    if "latitude" in data and not (isinstance(data["latitude"], (int, float)) and -90 <= data["latitude"] <= 90):
+        raise ValueError("latitude must be between -90 and 90")
+
+    if "longitude" in data and not (isinstance(data["longitude"], (int, float)) and -180 <= data["longitude"] <= 180):
+        raise ValueError("longitude must be between -180 and 180")
+
+    if "openAt" in data:
+        try:
+            parse_open_at(data["openAt"])
+        except (TypeError, ValueError):
+            raise ValueError("openAt must be 'now', a time of day (HH:MM) or a timestamp")
+
+
+def validate_inputs(cursor, data: dict, required_fields: list):
+    validate_input_types(data, required_fields)
+
+    if "restaurantId" in data and not restaurant_exists(cursor, data["restaurantId"]):
         raise ValueError(f"Restaurant '{data['restaurantId']}' not found")
 
-    try:
-        if "email" in data:
-            validate_email(data["email"])
-    except EmailNotValidError as error:
-        raise ValueError(f"Email '{data['email']}' is not a valid email")
+    if "email" in data:
+        normalize_email(data["email"])
 
 
 def add_customer_location_if_not_exists(cursor, location: str, customer_locations: set[str], user_id: int):
-    if customer_locations is None:
-        customer_locations = set()
-    if location not in customer_locations:
-        customer_locations.add(location)
-        cursor.execute("""
-        UPDATE USER SET LOCATION = ? WHERE USER_ID = ?
-        """, (json.dumps(list(customer_locations)), user_id,))
-        cursor.connection.commit()
+    # customer_locations is the legacy USER.LOCATION list, anything newer lives in USER_LOCATION
+    if customer_locations is not None and location in customer_locations:
+        return
+    if customer_location_buffer.add(user_id, location):
+        instrumentation.increment("customer_location_added")
+
+
+def get_customer_locations(cursor, user_id: int) -> set:
+    locations = {location for (location,) in cursor.execute("""
+    SELECT LOCATION FROM USER_LOCATION WHERE USER_ID = ?
+    """, (user_id,))}
+    return locations | customer_location_buffer.pending(user_id)
 
 
 def get_user(cursor, email: str):
-    return map_user(cursor.execute("SELECT * FROM USER WHERE EMAIL = ?", (email,)).fetchone())
+    # None when the email is not subscribed
+    return get_users(cursor, [email]).get(email)
+
+
+def get_users(cursor, emails) -> dict:
+    # email -> User for the subscribed ones; repeat customers come from user_catalog
+    users = {}
+    missing = {}  # normalized email -> emails as given
+    for email in emails:
+        key = normalize_email(email)
+        user = user_catalog.get(key)
+        if user is not None:
+            users[email] = user
+        else:
+            missing.setdefault(key, set()).add(email)
+    if not missing:
+        return users
+
+    # Misses go to USER_EMAIL_INDEX in one query, as given and normalized since USER keeps emails as entered
+    lookup = set(missing).union(*missing.values())
+    with instrumentation.stage("row_mapping"):
+        found = {
+            user.email: user for user in fetch_in_chunks(
+                mapped_cursor(cursor, user_row_factory), "SELECT * FROM USER WHERE EMAIL IN ({placeholders})", lookup
+            )
+        }
+    for key, given in missing.items():
+        for email in given:
+            user = found.get(email) or found.get(key)
+            if user is None:
+                continue
+            users[email] = user
+            user_catalog.put(key, user, [user_tag(user.id)])
+    return users
+
+
+def find_restaurants_by_location(cursor, location: str, min_rating: float = None):
+    key = ("location", location, min_rating)
+    restaurants = restaurant_catalog.get(key)
+    if restaurants is None:
+        restaurants = load_restaurants_by_location(cursor, location, min_rating)
+        restaurant_ids = [restaurant.id for restaurant in restaurants]
+        if min_rating is not None:
+            # Tagged with the filtered-out restaurants too, a rating lifting one over min_rating changes the list
+            restaurant_ids = [row[0] for row in cursor.execute(
+                "SELECT RESTAURANT_ID FROM RESTAURANT_LOCATION WHERE LOCATION = ?", (location,)
+            )]
+        restaurant_catalog.put(
+            key, restaurants, [location_tag(location)] + [restaurant_tag(r) for r in restaurant_ids]
+        )
+    return restaurants
 
 
-def simplex_strategy(location, cursor):
-    restaurants = map_restaurants(cursor.execute("SELECT * FROM RESTAURANT").fetchall())
-    customer_restaurants = [r for r in restaurants if
-                            r.location == location and r.overall_rating >= simplex_rating_threshold]
+def load_restaurants_by_location(cursor, location: str, min_rating: float = None):
+    query = """
+    SELECT RESTAURANT.* FROM RESTAURANT_LOCATION
+    JOIN RESTAURANT ON RESTAURANT.RESTAURANT_ID = RESTAURANT_LOCATION.RESTAURANT_ID
+    WHERE RESTAURANT_LOCATION.LOCATION = ?
+    """
+    params = (location,)
+    if min_rating is not None:
+        query += " AND RESTAURANT.OVERALL_RATING >= ?"
+        params += (min_rating,)
+    restaurant_cursor = mapped_cursor(cursor, restaurant_row_factory).execute(query, params)
+    # Rows are mapped by the row factory while they are fetched
+    with instrumentation.stage("row_mapping"):
+        return restaurant_cursor.fetchall()
+
+
+def open_restaurant_filter(cursor, location: str, open_at: int):
+    # None when the inquiry has no opening hours filter
+    if open_at is None:
+        return None
+    opening_hours_index.refresh(cursor)
+    return opening_hours_index.open_restaurants(location, open_at)
+
+
+def simplex_response(cursor, location):
+    # What simplex_strategy answers without an openAt filter, read fresh for the snapshot files
+    response = list()
+    for restaurant in load_restaurants_by_location(cursor, location, simplex_rating_threshold):
+        restaurant_response = RestaurantResponse(restaurant.name, restaurant.remaining_bags)
+        response.append(restaurant_response.to_api())
+    return response
+
+
+def simplex_strategy(location, cursor, open_at: int = None):
+    if open_at is None and availability_reader is not None:
+        response = availability_reader.response(location)
+        if response is not None:
+            return response
+    customer_restaurants = find_restaurants_by_location(cursor, location, simplex_rating_threshold)
+    open_restaurants = open_restaurant_filter(cursor, location, open_at)
     response = list()
     for restaurant in customer_restaurants:
+        if open_restaurants is not None and restaurant.id not in open_restaurants:
+            continue
         restaurant_response = RestaurantResponse(restaurant.name, restaurant.remaining_bags)
         response.append(restaurant_response.to_api())
     return response
 
 
+def nearest_strategy(coordinates, cursor, k: int = default_num_of_restaurants, open_at: int = None):
+    if coordinates is None:
+        raise ValueError("latitude and longitude are required for the nearest restaurants strategy")
+    restaurant_spatial_index.refresh(cursor)
+    if open_at is not None:
+        opening_hours_index.refresh(cursor)
+
+    def has_bags(restaurant_id):
+        if open_at is not None and not opening_hours_index.is_open(restaurant_id, open_at):
+            return False
+        restaurant = get_restaurant(cursor, restaurant_id)
+        return restaurant is not None and restaurant.remaining_bags > 0
+
+    response = list()
+    for _, restaurant_id in restaurant_spatial_index.nearest(coordinates[0], coordinates[1], k, accept=has_bags):
+        restaurant = get_restaurant(cursor, restaurant_id)
+        restaurant_response = RestaurantResponse(restaurant.name, restaurant.remaining_bags)
+        response.append(restaurant_response.to_api())
+    return response
+
+
+def ranked_strategy(location, cursor, k: int = default_num_of_restaurants, open_at: int = None):
+    restaurant_ranking.refresh(cursor)
+    open_restaurants = open_restaurant_filter(cursor, location, open_at)
+    accept = None if open_restaurants is None else open_restaurants.__contains__
+    response = list()
+    for _, name, remaining_bags in restaurant_ranking.top(location, k, accept):
+        restaurant_response = RestaurantResponse(name, remaining_bags)
+        response.append(restaurant_response.to_api())
+    return response
+
+
 def customer_inquiry(cursor, input_data):
-    validate_inputs(cursor, input_data, ["email", "location", "selectionStrategy"])
+    with instrumentation.stage("validation"):
+        validate_inputs(cursor, input_data, ["email", "location", "selectionStrategy"])
     email = input_data["email"]
     location = input_data["location"]
-    user = get_user(cursor, email)
-    print(user)
+    with instrumentation.stage("user_lookup"):
+        user = get_user(cursor, email)
     if user is None:
         raise ValueError(f"User '{email}' not subscribed")
-    add_customer_location_if_not_exists(cursor, location, user.location, user.id)
-    match input_data["selectionStrategy"]:
+    with instrumentation.stage("location_upsert"):
+        add_customer_location_if_not_exists(cursor, location, user.location, user.id)
+    with instrumentation.stage("strategy"):
+        sync_restaurant_changes(cursor)
+        return run_selection_strategy(
+            cursor, input_data["selectionStrategy"], location, inquiry_coordinates(input_data), inquiry_open_at(input_data)
+        )
+
+
+def inquiry_coordinates(input_data: dict):
+    if "latitude" in input_data and "longitude" in input_data:
+        return input_data["latitude"], input_data["longitude"]
+    return None
+
+
+def inquiry_open_at(input_data: dict):
+    # Resolved once per inquiry, so "now" is the same minute for every strategy of a batch entry
+    if "openAt" in input_data:
+        return parse_open_at(input_data["openAt"])
+    return None
+
+
+def run_selection_strategy(
+        cursor, selection_strategy: str, location: str, coordinates: tuple = None, open_at: int = None
+):
+    match selection_strategy:
         case "simplex":
-            return simplex_strategy(location, cursor)
+            return simplex_strategy(location, cursor, open_at)
         case "Kareem":
-            return None
+            return nearest_strategy(coordinates, cursor, open_at=open_at)
         case "Omar":
-            return None
+            return ranked_strategy(location, cursor, open_at=open_at)
         case "Bassel":
             return None
         case "Farah":
@@ -263,13 +564,68 @@ def customer_inquiry(cursor, input_data):
             return None
 
 
+def customer_inquiry_batch(cursor, inputs: list) -> list:
+    results = [None] * len(inputs)
+
+    valid_inputs = []
+    with instrumentation.stage("validation"):
+        for index, input_data in enumerate(inputs):
+            try:
+                validate_inputs(cursor, input_data, ["email", "location", "selectionStrategy"])
+            except (TypeError, ValueError) as error:
+                # One malformed payload only fails its own entry
+                results[index] = {"error": str(error)}
+                continue
+            valid_inputs.append((index, input_data))
+
+    # Resolve every user in one query
+    with instrumentation.stage("user_lookup"):
+        users = get_users(cursor, {input_data["email"] for _, input_data in valid_inputs})
+
+    resolved_inputs = []
+    for index, input_data in valid_inputs:
+        user = users.get(input_data["email"])
+        if user is None:
+            results[index] = {"error": f"User '{input_data['email']}' not subscribed"}
+            continue
+        try:
+            with instrumentation.stage("location_upsert"):
+                add_customer_location_if_not_exists(cursor, input_data["location"], user.location, user.id)
+        except (TypeError, ValueError) as error:
+            results[index] = {"error": str(error)}
+            continue
+        resolved_inputs.append((index, input_data))
+
+    # Run each distinct strategy and location only once
+    responses = {}
+    with instrumentation.stage("strategy"):
+        sync_restaurant_changes(cursor)
+    for index, input_data in resolved_inputs:
+        key = (
+            input_data["selectionStrategy"], input_data["location"],
+            inquiry_coordinates(input_data), inquiry_open_at(input_data)
+        )
+        if key not in responses:
+            try:
+                with instrumentation.stage("strategy"):
+                    responses[key] = {"result": run_selection_strategy(cursor, *key)}
+            except Exception as error:
+                responses[key] = {"error": str(error)}
+        response = responses[key]
+        if "result" in response and response["result"] is not None:
+            response = {"result": list(response["result"])}
+        results[index] = response
+    return results
+
+
 def customer_inquiry_api(input_data):
-    cursor = initialize_db()
-    try:
-        response = customer_inquiry(cursor, input_data)
-    finally:
-        cursor.connection.close()
-    return response
+    with instrumentation.request("customer_inquiry"), get_connection_pool().cursor() as cursor:
+        return customer_inquiry(cursor, input_data)
+
+
+def customer_inquiry_batch_api(inputs: list) -> list:
+    with instrumentation.request("customer_inquiry_batch"), get_connection_pool().cursor() as cursor:
+        return customer_inquiry_batch(cursor, inputs)
 
 
 if __name__ == "__main__":
@@ -282,6 +638,7 @@ if __name__ == "__main__":
     cursor.execute("DELETE FROM RESTAURANT")
     cursor.execute("DELETE FROM USER")
     cursor.connection.commit()
+    invalidate_user()
 
     cursor.execute("""
     INSERT INTO USER (EMAIL, NAME, PASSWORD, MOBILE_NUMBER, LAST_USED_AT)
@@ -296,7 +653,9 @@ if __name__ == "__main__":
             12,
             4.6,
             '2025-01-01T10:00:00',
-            '2025-01-01T22:00:00'
+            '2025-01-01T22:00:00',
+            30.0444,
+            31.2357
         ),
         (
             2,
@@ -306,7 +665,9 @@ if __name__ == "__main__":
             5,
             4.8,
             '2025-01-01T11:00:00',
-            '2025-01-01T21:00:00'
+            '2025-01-01T21:00:00',
+            30.0626,
+            31.2497
         ),
         (
             3,
@@ -316,7 +677,9 @@ if __name__ == "__main__":
             20,
             4.4,
             '2025-01-01T09:30:00',
-            '2025-01-01T23:00:00'
+            '2025-01-01T23:00:00',
+            29.9668,
+            32.5498
         ),
         (
             4,
@@ -326,7 +689,9 @@ if __name__ == "__main__":
             8,
             4.2,
             '2025-01-01T10:00:00',
-            '2025-01-01T20:00:00'
+            '2025-01-01T20:00:00',
+            29.9737,
+            32.5263
         ),
         (
             5,
@@ -336,7 +701,9 @@ if __name__ == "__main__":
             15,
             4.7,
             '2025-01-01T08:00:00',
-            '2025-01-01T22:00:00'
+            '2025-01-01T22:00:00',
+            29.9550,
+            32.5400
         )
     ]
 
@@ -344,13 +711,14 @@ if __name__ == "__main__":
         """
         INSERT INTO restaurant (
             restaurant_id, name, location, num_of_bags, remaining_bags,
-            overall_rating, opening_time, closing_time
+            overall_rating, opening_time, closing_time, latitude, longitude
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         restaurants
     )
     cursor.connection.commit()
+    invalidate_catalog()
     cursor.execute("""
     select * from USER
     """).fetchall()
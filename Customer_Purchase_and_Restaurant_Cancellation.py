@@ -1,97 +1,228 @@
+import atexit
+import sys
 import uuid #Ids
-restaurants = {
-    "r1": {"remaining_bags": 10},
-    "r2": {"remaining_bags": 5},
-}
-customer_locations = set()
-purchase_orders = {}
-def validate_inputs(data: dict, required_fields: list):
-    for field in required_fields:
-        if field not in data:
-            raise ValueError(f"Missing required field: {field}")
-
-    if "numberOfBags" in data and data["numberOfBags"] <= 0:
-        raise ValueError("numberOfBags must be > 0")
-
-    if "restaurantId" in data and data["restaurantId"] not in restaurants:
-        raise ValueError(f"Restaurant '{data['restaurantId']}' not found")
+from datetime import datetime
+from CustomerInquiryAndDataModels import (
+    PurchaseStatus,
+    add_customer_location_if_not_exists,
+    get_connection_pool,
+    mapped_cursor,
+    user_row_factory,
+    validate_inputs,
+)
+from catalog_cache import invalidate_restaurant
+from restaurant_index import fetch_in_chunks
+from bag_inventory import reconcile_bag_inventory, record_bag_event
+import instrumentation
+from notifications import NotificationDispatcher, PrintNotificationSink
+
+# Swap the sink (e.g. FileNotificationSink, InMemoryNotificationSink) to change where cancellations go
+cancellation_notifications = NotificationDispatcher(PrintNotificationSink())
+atexit.register(cancellation_notifications.close)
 
 #Helper Functions
-def add_customer_location_if_not_exists(location: str):
-    if location not in customer_locations:
-        customer_locations.add(location)
-def update_restaurant_remaining_bags(restaurant_id: str, change: int):
-    remaining = restaurants[restaurant_id]["remaining_bags"] + change
-    if remaining < 0:
-        raise ValueError("Not enough remaining bags at restaurant")
+def get_customer(cursor, email_or_phone: str):
+    user = mapped_cursor(cursor, user_row_factory).execute("SELECT * FROM USER WHERE EMAIL = ? OR MOBILE_NUMBER = ? LIMIT 1", (email_or_phone, email_or_phone)).fetchone()
+    if user is None:
+        raise ValueError(f"User '{email_or_phone}' not subscribed")
+    return user
 
-    restaurants[restaurant_id]["remaining_bags"] = remaining
+def update_restaurant_remaining_bags(cursor, restaurant_id: int, change: int, reason: str, reference_id: int = None):
+    # Single conditional update, so concurrent purchases can never oversell
+    rows = cursor.execute("""
+        UPDATE RESTAURANT SET REMAINING_BAGS = REMAINING_BAGS + ?
+        WHERE RESTAURANT_ID = ? AND REMAINING_BAGS + ? >= 0
+        RETURNING REMAINING_BAGS
+    """, (change, restaurant_id, change)).fetchall()
+    if not rows:
+        instrumentation.increment("restaurant_sold_out")
+        raise ValueError("Not enough remaining bags at restaurant")
+    # Every change is also appended to the ledger in the same transaction
+    record_bag_event(cursor, restaurant_id, change, rows[0][0], reason, reference_id)
+    return rows[0][0]
 
-def store_customer_purchase_order(order: dict):
-    purchase_id = str(uuid.uuid4()) #Random value for now
-    purchase_orders[purchase_id] = order
+def store_customer_purchase_order(cursor, user_id: int, input_data: dict):
+    purchase_id = uuid.uuid4().int >> 65 #Random value for now, fits in a signed 64-bit INTEGER
+    cursor.execute("""
+        INSERT INTO PURCHASE_ORDER
+        (PURCHASE_ORDER_ID, USER_ID, RESTAURANT_ID, NUM_OF_BAGS, LOCATION, ORDERD_AT, STATUS)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        purchase_id,
+        user_id,
+        input_data["restaurantId"],
+        input_data["numberOfBags"],
+        input_data["location"],
+        datetime.now().isoformat(),
+        PurchaseStatus.RESERVED.value
+    ))
     return purchase_id
 
-def send_cancellation_to_customers(restaurant_id: str):
-    print(f"Restaurant '{restaurant_id}' canceled")
-def update_purchase_order(order_id: str):
-    if order_id not in purchase_orders:
+def reserve_bags(cursor, user_id: int, input_data: dict):
+    # The bag reservation and the purchase order go in the caller's transaction and are committed together
+    purchase_id = store_customer_purchase_order(cursor, user_id, input_data)
+    remaining_bags = update_restaurant_remaining_bags(
+        cursor, input_data["restaurantId"], -input_data["numberOfBags"], "purchase", purchase_id
+    )
+    return purchase_id, remaining_bags
+
+def cancel_restaurant_orders(cursor, restaurant_id: int, user_cursor=None) -> list:
+    # Every reserved order of the restaurant, found through PURCHASE_ORDER_RESTAURANT_STATUS_INDEX
+    # Contacts are read through user_cursor when USER lives in another database (sharding)
+    user_cursor = user_cursor or cursor
+    orders = cursor.execute("""
+        UPDATE PURCHASE_ORDER SET STATUS = ?
+        WHERE RESTAURANT_ID = ? AND STATUS = ?
+        RETURNING PURCHASE_ORDER_ID, USER_ID, NUM_OF_BAGS
+    """, (PurchaseStatus.CANCELED.value, restaurant_id, PurchaseStatus.RESERVED.value)).fetchall()
+    contacts = {
+        user_id: (email, mobile_number) for user_id, email, mobile_number in fetch_in_chunks(
+            user_cursor, "SELECT USER_ID, EMAIL, MOBILE_NUMBER FROM USER WHERE USER_ID IN ({placeholders})",
+            {user_id for _, user_id, _ in orders}
+        )
+    }
+    notifications = []
+    for order_id, user_id, bags in orders:
+        email, mobile_number = contacts.get(user_id, (None, None))
+        notifications.append({
+            "restaurantId": restaurant_id,
+            "purchaseOrderId": order_id,
+            "userId": user_id,
+            "email": email,
+            "mobileNumber": mobile_number,
+            "bags": bags,
+        })
+    return notifications
+
+def send_cancellation_to_customers(notifications: list):
+    # Delivery runs on the notification workers, the caller does not wait for it
+    cancellation_notifications.enqueue(notifications)
+def update_purchase_order(cursor, order_id: int):
+    rows = cursor.execute("""
+        UPDATE PURCHASE_ORDER SET STATUS = ?
+        WHERE PURCHASE_ORDER_ID = ? AND STATUS = ?
+        RETURNING RESTAURANT_ID, NUM_OF_BAGS
+    """, (PurchaseStatus.CANCELED.value, order_id, PurchaseStatus.RESERVED.value)).fetchall()
+    if not rows:
         raise ValueError("Purchase order not found")
-    purchase_orders[order_id]["status"] = "cancelled"
-    return purchase_orders[order_id]
+    return {"restaurantId": rows[0][0], "bags": rows[0][1]}
+
+def cancel_customer_order(cursor, order_id: int):
+    order = update_purchase_order(cursor, order_id)
+    remaining_bags = update_restaurant_remaining_bags(
+        cursor, order["restaurantId"], order["bags"], "customer_cancel", order_id
+    )
+    return order, remaining_bags
 
 #Main Functions
 def customer_purchase(input_data: dict):
-    validate_inputs(input_data, ["restaurantId", "numberOfBags", "emailOrPhone", "location"])
-    add_customer_location_if_not_exists(input_data["location"])
-    update_restaurant_remaining_bags(input_data["restaurantId"], -input_data["numberOfBags"])
-
-    order = {
-        "restaurantId": input_data["restaurantId"],
-        "bags": input_data["numberOfBags"],
-        "emailOrPhone": input_data["emailOrPhone"],
-        "location": input_data["location"],
-        "status": "active",
-    }
-    purchase_id = store_customer_purchase_order(order)
+    with instrumentation.request("customer_purchase"), get_connection_pool().cursor() as cursor:
+        validate_inputs(cursor, input_data, ["restaurantId", "numberOfBags", "emailOrPhone", "location"])
+        user = get_customer(cursor, input_data["emailOrPhone"])
+        add_customer_location_if_not_exists(cursor, input_data["location"], user.location, user.id)
+        purchase_id, remaining_bags = reserve_bags(cursor, user.id, input_data)
+        cursor.connection.commit()
+    invalidate_restaurant(input_data["restaurantId"])
 
     return {
         "message": "Purchase successful",
         "purchaseOrderId": purchase_id,
-        "remainingBags": restaurants[input_data["restaurantId"]]["remaining_bags"],
+        "remainingBags": remaining_bags,
     }
 
 
 def restaurant_cancel(input_data: dict):
-    validate_inputs(input_data, ["restaurantId", "numberOfBags"])
-    send_cancellation_to_customers(input_data["restaurantId"])
-    update_restaurant_remaining_bags(input_data["restaurantId"], input_data["numberOfBags"])
+    with instrumentation.request("restaurant_cancel"), get_connection_pool().cursor() as cursor:
+        validate_inputs(cursor, input_data, ["restaurantId", "numberOfBags"])
+        notifications = cancel_restaurant_orders(cursor, input_data["restaurantId"])
+        remaining_bags = update_restaurant_remaining_bags(
+            cursor, input_data["restaurantId"], input_data["numberOfBags"], "restaurant_cancel"
+        )
+        cursor.connection.commit()
+    invalidate_restaurant(input_data["restaurantId"])
+    # Customers are only told once the cancellation is committed
+    send_cancellation_to_customers(notifications)
 
     return {
         "message": "Restaurant cancellation processed",
-        "remainingBags": restaurants[input_data["restaurantId"]]["remaining_bags"],
+        "remainingBags": remaining_bags,
+        "canceledOrders": len(notifications),
     }
 
 
 def customer_cancel(input_data: dict):
-    validate_inputs(input_data, ["purchaseOrderId", "emailOrPhone"])
-    order = update_purchase_order(input_data["purchaseOrderId"])
-    update_restaurant_remaining_bags(order["restaurantId"], order["bags"])
+    with instrumentation.request("customer_cancel"), get_connection_pool().cursor() as cursor:
+        validate_inputs(cursor, input_data, ["purchaseOrderId", "emailOrPhone"])
+        order, remaining_bags = cancel_customer_order(cursor, input_data["purchaseOrderId"])
+        cursor.connection.commit()
+    invalidate_restaurant(order["restaurantId"])
 
     return {
         "message": "Customer cancellation processed",
-        "remainingBags": restaurants[order["restaurantId"]]["remaining_bags"],
+        "remainingBags": remaining_bags,
     }
-from datetime import datetime
 
 # Adding Rating Module
 
-def updateRestaurantRating (cursor, restaurantID):
-  row = cursor.execute("SELECT AVG(rating) FROM CUSTOMER_RATINGS WHERE restaurant_id = ? ", (restaurantID,)).fetchone()
-  newOverallRating = row[0]
-  cursor.execute("UPDATE RESTAURANT SET overall_rating = ? WHERE restaurant_id = ? ", (newOverallRating, restaurantID))
+def updateRestaurantRating (cursor, restaurantID, ratingDelta: float, countDelta: int, restaurantCursor=None):
+  # Keep a running sum and count instead of averaging every rating the restaurant ever got.
+  # restaurantCursor is the restaurant's own database when it lives in a shard, ratings stay in the main one
+  seeded = cursor.execute("SELECT 1 FROM RESTAURANT_RATING_AGGREGATE WHERE restaurant_id = ? ", (restaurantID,)).fetchone()
+  if seeded:
+    row = cursor.execute("""
+      UPDATE RESTAURANT_RATING_AGGREGATE SET rating_sum = rating_sum + ?, rating_count = rating_count + ?
+      WHERE restaurant_id = ? RETURNING rating_sum, rating_count
+    """, (ratingDelta, countDelta, restaurantID)).fetchall()[0]
+  else:
+    # First rating seen since aggregates were introduced, seed from the ratings already stored (including this one)
+    row = cursor.execute("""
+      INSERT INTO RESTAURANT_RATING_AGGREGATE (restaurant_id, rating_sum, rating_count)
+      SELECT ?, COALESCE(SUM(rating), 0), COUNT(*) FROM CUSTOMER_RATINGS WHERE restaurant_id = ?
+      RETURNING rating_sum, rating_count
+    """, (restaurantID, restaurantID)).fetchall()[0]
+  newOverallRating = row[0] / row[1] if row[1] else None
+  (restaurantCursor or cursor).execute("UPDATE RESTAURANT SET overall_rating = ? WHERE restaurant_id = ? ", (newOverallRating, restaurantID))
+  invalidate_restaurant(restaurantID)
+
+def reconcileRestaurantRatings (cursor, fix: bool = True):
+  # Recompute every aggregate from CUSTOMER_RATINGS and report (and optionally repair) the ones that drifted
+  expected = {
+    restaurantID: (ratingSum, ratingCount)
+    for restaurantID, ratingSum, ratingCount in cursor.execute(
+      "SELECT restaurant_id, SUM(rating), COUNT(*) FROM CUSTOMER_RATINGS GROUP BY restaurant_id").fetchall()
+  }
+  actual = {
+    restaurantID: (ratingSum, ratingCount)
+    for restaurantID, ratingSum, ratingCount in cursor.execute(
+      "SELECT restaurant_id, rating_sum, rating_count FROM RESTAURANT_RATING_AGGREGATE").fetchall()
+  }
+
+  drift = []
+  for restaurantID in expected.keys() | actual.keys():
+    expectedSum, expectedCount = expected.get(restaurantID, (0, 0))
+    actualSum, actualCount = actual.get(restaurantID, (0, 0))
+    if expectedCount != actualCount or abs(expectedSum - actualSum) > 1e-6:
+      drift.append({
+        "restaurantId": restaurantID,
+        "expectedSum": expectedSum,
+        "expectedCount": expectedCount,
+        "actualSum": actualSum,
+        "actualCount": actualCount,
+      })
+
+  if fix:
+    for item in drift:
+      restaurantID = item["restaurantId"]
+      cursor.execute("DELETE FROM RESTAURANT_RATING_AGGREGATE WHERE restaurant_id = ? ", (restaurantID,))
+      if item["expectedCount"]:
+        cursor.execute("INSERT INTO RESTAURANT_RATING_AGGREGATE (restaurant_id, rating_sum, rating_count) VALUES (?, ?, ?)",
+                       (restaurantID, item["expectedSum"], item["expectedCount"]))
+      newOverallRating = item["expectedSum"] / item["expectedCount"] if item["expectedCount"] else None
+      cursor.execute("UPDATE RESTAURANT SET overall_rating = ? WHERE restaurant_id = ? ", (newOverallRating, restaurantID))
+      invalidate_restaurant(restaurantID)
+  return drift
 
-def updateCustomerRestaurantRating (cursor, userID, restaurantID, customerRating: int):
+def updateCustomerRestaurantRating (cursor, userID, restaurantID, customerRating: int, restaurantCursor=None):
 
     # Validate rating
     if not (0 <= customerRating <= 5):
@@ -105,39 +236,61 @@ def updateCustomerRestaurantRating (cursor, userID, restaurantID, customerRating
     if existing:
         # Update existing rating
         cursor.execute("UPDATE CUSTOMER_RATINGS SET rating = ?, updated_at = ? WHERE user_id = ? AND restaurant_id = ?",(customerRating, current_time, userID, restaurantID))
+        updateRestaurantRating(cursor, restaurantID, customerRating - existing[0], 0, restaurantCursor)
     else:
         # Insert new rating
         cursor.execute("INSERT INTO CUSTOMER_RATINGS (user_id, restaurant_id, rating, updated_at) VALUES (?, ?, ?, ?)",(userID, restaurantID, customerRating, current_time))
-    updateRestaurantRating(cursor, restaurantID)
+        updateRestaurantRating(cursor, restaurantID, customerRating, 1, restaurantCursor)
 
-if __name__ == "__main__":
-    print("Initial restaurant state:", restaurants)
+def customer_rating_api(userID, restaurantID, customerRating: int):
+    with instrumentation.request("customer_rating"), get_connection_pool().cursor() as cursor:
+        updateCustomerRestaurantRating(cursor, userID, restaurantID, customerRating)
+
+if __name__ == "__main__" and sys.argv[1:] == ["reconcile-ratings"]:
+    with get_connection_pool().cursor() as cursor:
+        drift = reconcileRestaurantRatings(cursor)
+    print(f"Reconciled rating aggregates, {len(drift)} restaurant(s) had drifted")
+    for item in drift:
+        print(item)
+elif __name__ == "__main__" and sys.argv[1:] == ["reconcile-bags"]:
+    with get_connection_pool().cursor() as cursor:
+        drift = reconcile_bag_inventory(cursor)
+    print(f"Reconciled the bag ledger with remaining bags, {len(drift)} restaurant(s) had drifted")
+    for item in drift:
+        print(item)
+elif __name__ == "__main__":
+    # Uses the user and restaurants seeded by CustomerInquiryAndDataModels.py
+    def print_remaining_bags():
+        with get_connection_pool().cursor() as cursor:
+            print(cursor.execute("SELECT RESTAURANT_ID, REMAINING_BAGS FROM RESTAURANT").fetchall())
+
+    print("Initial restaurant state:")
+    print_remaining_bags()
     purchase_result = customer_purchase({
-        "restaurantId": "r1",
+        "restaurantId": 1,
         "numberOfBags": 3,
-        "emailOrPhone": "hank@example.com",
-        "location": "Downtown"
+        "emailOrPhone": "hank@gmail.com",
+        "location": "CAIRO"
     })
     print("Customer Purchase Result:")
     print(purchase_result)
-    print("Restaurants after purchase:", restaurants)
-    print("Purchase Orders:", purchase_orders)
+    print("Restaurants after purchase:")
+    print_remaining_bags()
     # Save the purchase ID for later cancellation
     pid = purchase_result["purchaseOrderId"]
     cancel_result = customer_cancel({
         "purchaseOrderId": pid,
-        "emailOrPhone": "hank@example.com"
+        "emailOrPhone": "hank@gmail.com"
     })
     print("Customer Cancellation Result:")
     print(cancel_result)
-    print("Restaurants after customer cancel:", restaurants)
-    print("Purchase Orders:", purchase_orders)
+    print("Restaurants after customer cancel:")
+    print_remaining_bags()
     restaurant_cancel_result = restaurant_cancel({
-        "restaurantId": "r2",
+        "restaurantId": 2,
         "numberOfBags": 2
     })
     print("Restaurant Cancellation Result:")
     print(restaurant_cancel_result)
-    print("Restaurants after restaurant cancel:", restaurants)
-
-
+    print("Restaurants after restaurant cancel:")
+    print_remaining_bags()
@@ -0,0 +1,69 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from CustomerInquiryAndDataModels import (
+    customer_inquiry_api,
+    customer_inquiry_batch_api,
+    customer_location_buffer,
+    get_connection_pool,
+)
+from Customer_Purchase_and_Restaurant_Cancellation import (
+    customer_cancel,
+    customer_purchase,
+    customer_rating_api,
+    restaurant_cancel,
+)
+
+default_max_pending = 100
+
+
+class AsyncFoodBagsService:
+    def __init__(self, max_workers: int = None, max_pending: int = default_max_pending, queue_timeout: float = None):
+        # More workers than pooled connections would only queue up inside the pool
+        self.max_workers = max_workers or get_connection_pool().size
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="foodbags-db")
+        self._pending = None
+
+    async def _run(self, func, *args):
+        # Backpressure: at most max_pending requests are admitted, the rest wait (or time out) here
+        if self._pending is None:
+            self._pending = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._pending.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"FoodBags service is overloaded, no slot within {self.queue_timeout}s")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+        finally:
+            self._pending.release()
+
+    async def customer_inquiry(self, input_data: dict):
+        return await self._run(customer_inquiry_api, input_data)
+
+    async def customer_inquiry_batch(self, inputs: list) -> list:
+        return await self._run(customer_inquiry_batch_api, inputs)
+
+    async def customer_purchase(self, input_data: dict) -> dict:
+        return await self._run(customer_purchase, input_data)
+
+    async def customer_cancel(self, input_data: dict) -> dict:
+        return await self._run(customer_cancel, input_data)
+
+    async def restaurant_cancel(self, input_data: dict) -> dict:
+        return await self._run(restaurant_cancel, input_data)
+
+    async def update_customer_restaurant_rating(self, user_id: int, restaurant_id: int, rating: int):
+        return await self._run(customer_rating_api, user_id, restaurant_id, rating)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        customer_location_buffer.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,194 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import threading
+from urllib.parse import quote, unquote
+
+from restaurant_index import fetch_in_chunks
+
+default_snapshot_directory = "availability"
+default_debounce_seconds = 0.2
+
+
+def snapshot_path(directory: str, location: str) -> str:
+    # Quoted rather than slugged, so "New Cairo" and "new-cairo" can never share a file
+    return os.path.join(directory, quote(location, safe="") + ".json")
+
+
+def write_snapshot(directory: str, location: str, response: list):
+    # Written aside and renamed over the old file, readers see either snapshot but never half of one
+    path = snapshot_path(directory, location)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as snapshot:
+        snapshot.write(json.dumps(response, separators=(",", ":")).encode("utf-8"))
+    os.replace(temporary, path)
+
+
+class AvailabilitySnapshotReader:
+    def __init__(self, directory: str = default_snapshot_directory):
+        self.directory = directory
+        # location -> (file identity, mapping, parsed response); one stat per request spots a new snapshot
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def _snapshot(self, location: str):
+        path = snapshot_path(self.directory, location)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        snapshot = self._snapshots.get(location)
+        if snapshot is not None and snapshot[0] == identity:
+            return snapshot
+        try:
+            with open(path, "rb") as source:
+                mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        # The replaced mapping is not closed here, callers may still hold a view of it
+        snapshot = (identity, mapping, None)
+        with self._lock:
+            self._snapshots[location] = snapshot
+        return snapshot
+
+    def response_bytes(self, location: str):
+        # The JSON body as it is on disk, to send without decoding; None when the location has no snapshot
+        snapshot = self._snapshot(location)
+        return None if snapshot is None else memoryview(snapshot[1])
+
+    def response(self, location: str):
+        snapshot = self._snapshot(location)
+        if snapshot is None:
+            return None
+        identity, mapping, response = snapshot
+        if response is None:
+            # Decoded once per snapshot version and shared by every request until the next one
+            response = json.loads(mapping[:])
+            with self._lock:
+                if self._snapshots.get(location, (None,))[0] == identity:
+                    self._snapshots[location] = (identity, mapping, response)
+        return list(response)
+
+
+class AvailabilityMaterializer:
+    def __init__(self, cursor_factory, load_response, debounce_seconds: float = default_debounce_seconds):
+        # load_response(cursor, location) returns the inquiry response to materialize for the location
+        self.cursor_factory = cursor_factory
+        self.load_response = load_response
+        self.debounce_seconds = debounce_seconds
+        self.directory = None  # off until enable(), only processes that write bags need to materialize
+        self._locations = {}  # restaurant_id -> locations of its last materialization
+        self._dirty = set()
+        self._rebuild = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def enable(self, directory: str = default_snapshot_directory):
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self.directory = directory
+            self._rebuild = True
+            if self._worker is None:
+                self._stopped.clear()
+                self._worker = threading.Thread(target=self._run, name="foodbags-availability", daemon=True)
+                self._worker.start()
+        self.flush()
+
+    def invalidate(self, restaurant_id=None):
+        with self._lock:
+            if self.directory is None:
+                return
+            if restaurant_id is None:
+                self._rebuild = True
+            else:
+                self._dirty.add(restaurant_id)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            # Bag changes arriving during the debounce are written with the same pass
+            self._stopped.wait(self.debounce_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                print(f"Availability snapshot failed: {error}", file=sys.stderr)
+
+    def _restaurant_locations(self, cursor, restaurant_ids=None) -> dict:
+        query = "SELECT RESTAURANT_ID, LOCATION FROM RESTAURANT_LOCATION"
+        if restaurant_ids is None:
+            found = cursor.execute(query).fetchall()
+        else:
+            found = fetch_in_chunks(cursor, query + " WHERE RESTAURANT_ID IN ({placeholders})", restaurant_ids)
+        locations = {}
+        for restaurant_id, location in found:
+            locations.setdefault(restaurant_id, set()).add(location)
+        return locations
+
+    def flush(self) -> int:
+        # Rewrites the snapshot of every location a changed restaurant serves or used to serve
+        with self._flush_lock:
+            with self._lock:
+                directory = self.directory
+                rebuild, dirty = self._rebuild, self._dirty
+                self._rebuild, self._dirty = False, set()
+            if directory is None or not (rebuild or dirty):
+                return 0
+            try:
+                with self.cursor_factory() as cursor:
+                    if rebuild:
+                        # Files left by an earlier run are rewritten too, a location without restaurants becomes []
+                        previous = set().union(*self._locations.values()) | {
+                            unquote(name[:-len(".json")]) for name in os.listdir(directory) if name.endswith(".json")
+                        }
+                        self._locations = self._restaurant_locations(cursor)
+                        locations = previous | set().union(*self._locations.values())
+                    else:
+                        current = self._restaurant_locations(cursor, dirty)
+                        locations = set()
+                        for restaurant_id in dirty:
+                            locations |= self._locations.pop(restaurant_id, set())
+                            if restaurant_id in current:
+                                self._locations[restaurant_id] = current[restaurant_id]
+                                locations |= current[restaurant_id]
+                    responses = [(location, self.load_response(cursor, location)) for location in locations]
+            except BaseException:
+                with self._lock:
+                    self._rebuild = self._rebuild or rebuild
+                    self._dirty |= set(dirty)
+                raise
+            for location, response in responses:
+                write_snapshot(directory, location, response)
+            return len(responses)
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.flush()
+
+
+def main():
+    # Imported here, CustomerInquiryAndDataModels itself imports this module
+    from CustomerInquiryAndDataModels import availability_materializer
+
+    parser = argparse.ArgumentParser(description="Write the availability snapshot of every location once")
+    parser.add_argument("--directory", default=default_snapshot_directory)
+    args = parser.parse_args()
+
+    availability_materializer.enable(args.directory)
+    availability_materializer.close()
+    print(f"Availability snapshots written to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from restaurant_index import fetch_in_chunks
+
+# The ledger is the audit trail of RESTAURANT.REMAINING_BAGS, which stays the count every reader uses
+snapshot_every_events = 100  # per restaurant, bounds how many deltas a replay has to read
+
+
+def record_bag_event(cursor, restaurant_id: int, change: int, remaining_bags: int, reason: str, reference_id: int = None):
+    # Runs in the caller's transaction, right after the guarded REMAINING_BAGS update
+    event_id = cursor.execute("""
+    INSERT INTO BAG_LEDGER (RESTAURANT_ID, DELTA, REASON, REFERENCE_ID, CREATED_AT)
+    VALUES (?, ?, ?, ?, ?) RETURNING EVENT_ID
+    """, (restaurant_id, change, reason, reference_id, datetime.now().isoformat())).fetchone()[0]
+    # Counted from the ledger in the same transaction, so it holds across processes and is undone by a rollback
+    pending = cursor.execute("""
+    SELECT COUNT(*) FROM (
+    SELECT 1 FROM BAG_LEDGER WHERE RESTAURANT_ID = ?
+    AND EVENT_ID > COALESCE((SELECT LAST_EVENT_ID FROM BAG_SNAPSHOT WHERE RESTAURANT_ID = ?), 0)
+    LIMIT ?)
+    """, (restaurant_id, restaurant_id, snapshot_every_events)).fetchone()[0]
+    if pending >= snapshot_every_events:
+        cursor.execute("""
+        INSERT INTO BAG_SNAPSHOT (RESTAURANT_ID, REMAINING_BAGS, LAST_EVENT_ID, TAKEN_AT) VALUES (?, ?, ?, ?)
+        ON CONFLICT (RESTAURANT_ID) DO UPDATE SET
+        REMAINING_BAGS = excluded.REMAINING_BAGS, LAST_EVENT_ID = excluded.LAST_EVENT_ID, TAKEN_AT = excluded.TAKEN_AT
+        """, (restaurant_id, remaining_bags, event_id, datetime.now().isoformat()))
+    return event_id
+
+
+def replay_bag_inventory(cursor, restaurant_ids=None) -> dict:
+    # restaurant_id -> (remaining_bags, last_event_id), the latest snapshot plus every delta after it
+    query = """
+    SELECT BAG_SNAPSHOT.RESTAURANT_ID,
+    BAG_SNAPSHOT.REMAINING_BAGS + COALESCE(SUM(BAG_LEDGER.DELTA), 0),
+    MAX(BAG_SNAPSHOT.LAST_EVENT_ID, COALESCE(MAX(BAG_LEDGER.EVENT_ID), 0))
+    FROM BAG_SNAPSHOT
+    LEFT JOIN BAG_LEDGER ON BAG_LEDGER.RESTAURANT_ID = BAG_SNAPSHOT.RESTAURANT_ID
+    AND BAG_LEDGER.EVENT_ID > BAG_SNAPSHOT.LAST_EVENT_ID
+    """
+    if restaurant_ids is None:
+        rows = cursor.execute(query + " GROUP BY BAG_SNAPSHOT.RESTAURANT_ID").fetchall()
+    else:
+        rows = fetch_in_chunks(
+            cursor, query + " WHERE BAG_SNAPSHOT.RESTAURANT_ID IN ({placeholders}) GROUP BY BAG_SNAPSHOT.RESTAURANT_ID",
+            restaurant_ids
+        )
+    return {restaurant_id: (remaining_bags, last_event_id) for restaurant_id, remaining_bags, last_event_id in rows}
+
+
+def reconcile_bag_inventory(cursor, fix: bool = True) -> list:
+    # Compares the ledger replay with RESTAURANT.REMAINING_BAGS, like reconcileRestaurantRatings.
+    # The column is authoritative: a drifted ledger (e.g. after a direct UPDATE) gets a compensating 'reconcile'
+    # event, the count itself is never rewritten. Compared and repaired in one write transaction, so no purchase
+    # can commit in between
+    conn = cursor.connection
+    if not conn.in_transaction:
+        cursor.execute("BEGIN IMMEDIATE" if fix else "BEGIN")
+    try:
+        replayed = replay_bag_inventory(cursor)
+        drift = []
+        for restaurant_id, remaining_bags in cursor.execute("SELECT RESTAURANT_ID, REMAINING_BAGS FROM RESTAURANT").fetchall():
+            if restaurant_id in replayed and replayed[restaurant_id][0] != remaining_bags:
+                drift.append({
+                    "restaurantId": restaurant_id,
+                    "stored": remaining_bags,
+                    "ledger": replayed[restaurant_id][0],
+                })
+        if fix:
+            for item in drift:
+                record_bag_event(
+                    cursor, item["restaurantId"], item["stored"] - item["ledger"], item["stored"], "reconcile"
+                )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return drift
@@ -0,0 +1,162 @@
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+from CustomerInquiryAndDataModels import PurchaseStatus
+from migrations import connect
+
+DATA_SIZES = {
+    "small": {"users": 1000, "restaurants": 100, "locations": 10, "purchase_orders": 5000, "ratings": 5000},
+    "medium": {"users": 10000, "restaurants": 1000, "locations": 50, "purchase_orders": 50000, "ratings": 50000},
+    "large": {"users": 100000, "restaurants": 10000, "locations": 200, "purchase_orders": 500000, "ratings": 500000},
+}
+insert_batch_size = 10000
+
+
+def location_name(index: int) -> str:
+    return f"CITY_{index}"
+
+
+def user_email(user_id: int) -> str:
+    return f"user{user_id}@example.com"
+
+
+def location_center(index: int) -> tuple:
+    # A grid of cities 0.5 degrees apart around Cairo, so nearest-restaurant queries have neighbours to find
+    return 30.0 + (index % 10) * 0.5, 31.0 + (index // 10) * 0.5
+
+
+def _insert_in_batches(cursor, statement, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= insert_batch_size:
+            cursor.executemany(statement, batch)
+            batch = []
+    if batch:
+        cursor.executemany(statement, batch)
+
+
+def generate_data(
+        database: str,
+        users: int,
+        restaurants: int,
+        locations: int,
+        purchase_orders: int,
+        ratings: int,
+        seed: int = 0
+):
+    rng = random.Random(seed)
+    # Coordinates come from their own stream, so the rest of the data is the same as before they existed
+    coordinate_rng = random.Random(f"coordinates-{seed}")
+    conn = connect(database)
+    cursor = conn.cursor()
+    now = datetime.now()
+
+    _insert_in_batches(cursor, """
+    INSERT INTO USER (USER_ID, NAME, EMAIL, PASSWORD, MOBILE_NUMBER, LAST_USED_AT, LOCATION)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        (
+            user_id,
+            f"user{user_id}",
+            user_email(user_id),
+            "password",
+            100000000 + user_id,
+            now.isoformat(),
+            json.dumps([location_name(rng.randrange(locations))])
+        )
+        for user_id in range(1, users + 1)
+    ))
+
+    def restaurant_rows():
+        for restaurant_id in range(1, restaurants + 1):
+            num_of_bags = rng.randint(10, 60)
+            opening_hour = rng.randint(6, 12)
+            location_indexes = sorted({rng.randrange(locations) for _ in range(rng.randint(1, 3))})
+            latitude, longitude = location_center(location_indexes[0])
+            yield (
+                restaurant_id,
+                f"Restaurant {restaurant_id}",
+                json.dumps(sorted(location_name(index) for index in location_indexes)),
+                num_of_bags,
+                num_of_bags,
+                round(rng.uniform(1.0, 5.0), 1),
+                now.replace(hour=opening_hour, minute=0, second=0, microsecond=0).isoformat(),
+                now.replace(hour=opening_hour + rng.randint(8, 11), minute=0, second=0, microsecond=0).isoformat(),
+                latitude + coordinate_rng.uniform(-0.1, 0.1),
+                longitude + coordinate_rng.uniform(-0.1, 0.1)
+            )
+
+    _insert_in_batches(cursor, """
+    INSERT INTO RESTAURANT (
+        RESTAURANT_ID, NAME, LOCATION, NUM_OF_BAGS, REMAINING_BAGS,
+        OVERALL_RATING, OPENING_TIME, CLOSING_TIME, LATITUDE, LONGITUDE
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, restaurant_rows())
+
+    statuses = [status.value for status in PurchaseStatus]
+    _insert_in_batches(cursor, """
+    INSERT INTO PURCHASE_ORDER (PURCHASE_ORDER_ID, USER_ID, RESTAURANT_ID, NUM_OF_BAGS, LOCATION, ORDERD_AT, STATUS)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        (
+            order_id,
+            rng.randint(1, users),
+            rng.randint(1, restaurants),
+            rng.randint(1, 3),
+            location_name(rng.randrange(locations)),
+            (now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))).isoformat(),
+            rng.choice(statuses)
+        )
+        for order_id in range(1, purchase_orders + 1)
+    ))
+
+    # One rating per (user, restaurant) pair, like updateCustomerRestaurantRating enforces
+    rated = set()
+    ratings = min(ratings, users * restaurants)
+
+    def rating_rows():
+        while len(rated) < ratings:
+            pair = (rng.randint(1, users), rng.randint(1, restaurants))
+            if pair in rated:
+                continue
+            rated.add(pair)
+            yield pair + (rng.randint(0, 5), now.isoformat())
+
+    _insert_in_batches(cursor, """
+    INSERT INTO CUSTOMER_RATINGS (USER_ID, RESTAURANT_ID, RATING, UPDATED_AT) VALUES (?, ?, ?, ?)
+    """, rating_rows())
+    cursor.execute("""
+    INSERT INTO RESTAURANT_RATING_AGGREGATE (RESTAURANT_ID, RATING_SUM, RATING_COUNT)
+    SELECT RESTAURANT_ID, SUM(RATING), COUNT(*) FROM CUSTOMER_RATINGS GROUP BY RESTAURANT_ID
+    """)
+    cursor.execute("""
+    UPDATE RESTAURANT SET OVERALL_RATING = (
+        SELECT RATING_SUM / RATING_COUNT FROM RESTAURANT_RATING_AGGREGATE
+        WHERE RESTAURANT_RATING_AGGREGATE.RESTAURANT_ID = RESTAURANT.RESTAURANT_ID)
+    WHERE RESTAURANT_ID IN (SELECT RESTAURANT_ID FROM RESTAURANT_RATING_AGGREGATE)
+    """)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a FoodBags database with synthetic data")
+    parser.add_argument("database")
+    parser.add_argument("--size", choices=DATA_SIZES, default="small", help="preset for the counts below")
+    for name in DATA_SIZES["small"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = dict(DATA_SIZES[args.size])
+    counts.update({name: getattr(args, name) for name in counts if getattr(args, name) is not None})
+    generate_data(args.database, seed=args.seed, **counts)
+    print(f"Generated {counts} into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
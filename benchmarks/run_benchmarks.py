@@ -0,0 +1,205 @@
+import argparse
+import json
+import math
+import os
+import platform
+import queue
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import email_validator
+
+from CustomerInquiryAndDataModels import PurchaseStatus, configure_connection_pool, customer_inquiry_api
+from Customer_Purchase_and_Restaurant_Cancellation import (
+    cancellation_notifications,
+    customer_cancel,
+    customer_purchase,
+    customer_rating_api,
+    restaurant_cancel,
+)
+from benchmarks.data_generator import DATA_SIZES, generate_data, location_name, user_email
+
+OPERATIONS = [
+    "customer_inquiry",
+    "customer_purchase",
+    "customer_cancel",
+    "restaurant_cancel",
+    "updateCustomerRestaurantRating",
+]
+
+
+class DiscardNotificationSink:
+    # Delivery is asynchronous, printing every notification would only slow the workers and flood the report
+    def deliver(self, notifications):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def make_requests(operation, counts, database, rng):
+    # Returns a callable producing the next call for the operation
+    users, restaurants, locations = counts["users"], counts["restaurants"], counts["locations"]
+
+    if operation == "customer_inquiry":
+        return lambda: customer_inquiry_api({
+            "email": user_email(rng.randint(1, users)),
+            "location": location_name(rng.randrange(locations)),
+            "selectionStrategy": "simplex"
+        })
+    if operation == "customer_purchase":
+        return lambda: customer_purchase({
+            "restaurantId": rng.randint(1, restaurants),
+            "numberOfBags": 1,
+            "emailOrPhone": user_email(rng.randint(1, users)),
+            "location": location_name(rng.randrange(locations))
+        })
+    if operation == "customer_cancel":
+        # Every cancel needs its own still-reserved order
+        reserved = queue.SimpleQueue()
+        conn = sqlite3.connect(database)
+        for (order_id,) in conn.execute(
+                "SELECT PURCHASE_ORDER_ID FROM PURCHASE_ORDER WHERE STATUS = ?", (PurchaseStatus.RESERVED.value,)):
+            reserved.put(order_id)
+        conn.close()
+        return lambda: customer_cancel({
+            "purchaseOrderId": reserved.get_nowait(),
+            "emailOrPhone": user_email(1)
+        })
+    if operation == "restaurant_cancel":
+        return lambda: restaurant_cancel({
+            "restaurantId": rng.randint(1, restaurants),
+            "numberOfBags": 1
+        })
+    if operation == "updateCustomerRestaurantRating":
+        return lambda: customer_rating_api(rng.randint(1, users), rng.randint(1, restaurants), rng.randint(0, 5))
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+def run_operation(operation, counts, database, threads, requests_per_thread, seed):
+    configure_connection_pool(size=threads, database=database)
+    next_request = make_requests(operation, counts, database, random.Random(seed))
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        start_barrier.wait()
+        for _ in range(requests_per_thread):
+            started = time.perf_counter()
+            try:
+                next_request()
+            except (ValueError, queue.Empty):
+                # Business errors (sold out, already canceled) are still served requests
+                local_errors += 1
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "operation": operation,
+        "threads": threads,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes, thread_counts, operations, requests_per_thread, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="foodbags-bench-") as workdir:
+        for size in sizes:
+            counts = DATA_SIZES[size]
+            template = os.path.join(workdir, f"{size}.db")
+            generate_data(template, seed=seed, **counts)
+            for threads in thread_counts:
+                for operation in operations:
+                    # Each run starts from the same data, so writes from one run do not skew the next
+                    database = os.path.join(workdir, f"{size}-{threads}-{operation}.db")
+                    shutil.copyfile(template, database)
+                    result = run_operation(operation, counts, database, threads, requests_per_thread, seed)
+                    result["dataSize"] = size
+                    result["counts"] = counts
+                    results.append(result)
+                    print(f"{size:>6} {threads:>3} threads {operation:<31} "
+                          f"{result['throughput']:>9.0f} req/s  p50 {result['p50_ms']:.2f}ms  "
+                          f"p99 {result['p99_ms']:.2f}ms  errors {result['errors']}")
+                    os.remove(database)
+    return {
+        "meta": {
+            "createdAt": datetime.now().isoformat(),
+            "gitRevision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "requestsPerThread": requests_per_thread,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FoodBags entry point throughput and latency")
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated, from {', '.join(DATA_SIZES)}")
+    parser.add_argument("--threads", default="1,4,8", help="comma-separated thread counts")
+    parser.add_argument("--operations", default=",".join(OPERATIONS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per thread per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--check-deliverability", action="store_true",
+                        help="let email validation do DNS lookups, like production")
+    args = parser.parse_args()
+
+    email_validator.CHECK_DELIVERABILITY = args.check_deliverability
+    cancellation_notifications.sink = DiscardNotificationSink()
+    report = run_benchmarks(
+        args.sizes.split(","),
+        [int(threads) for threads in args.threads.split(",")],
+        args.operations.split(","),
+        args.requests,
+        args.seed
+    )
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+
+default_ttl_seconds = 30.0
+default_max_entries = 1024
+
+
+class CatalogCache:
+    def __init__(
+            self,
+            ttl_seconds: float = default_ttl_seconds,
+            max_entries: int = default_max_entries,
+            clock=time.monotonic
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires_at, value, tags), least recently used first
+        self._entries = OrderedDict()
+        # tag -> keys of the entries carrying it, so a write can drop exactly what it touched
+        self._keys_by_tag = {}
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] <= self.clock():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tags = frozenset(tags)
+            self._entries[key] = (self.clock() + self.ttl_seconds, value, tags)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+restaurant_catalog = CatalogCache()
+_invalidation_listeners = []
+_synced_change_ids = {}  # database file -> latest RESTAURANT_CHANGE already invalidated, missing until its first sync
+_sync_lock = threading.Lock()
+
+
+def restaurant_tag(restaurant_id):
+    return "restaurant", restaurant_id
+
+
+def location_tag(location: str):
+    return "location", location
+
+
+def add_invalidation_listener(listener):
+    # listener(restaurant_id) after a restaurant write, listener(None) when the whole catalog is dropped
+    _invalidation_listeners.append(listener)
+
+
+def invalidate_restaurant(restaurant_id, locations=None):
+    # locations only needs to be passed for new restaurants, which no cached location list references yet
+    tags = [restaurant_tag(restaurant_id)]
+    if locations is not None:
+        tags.extend(location_tag(location) for location in locations)
+    restaurant_catalog.invalidate(*tags)
+    for listener in _invalidation_listeners:
+        listener(restaurant_id)
+
+
+def invalidate_catalog():
+    with _sync_lock:
+        _synced_change_ids.clear()
+    restaurant_catalog.clear()
+    for listener in _invalidation_listeners:
+        listener(None)
+
+
+def sync_restaurant_changes(cursor):
+    # Invalidates the restaurants written by other processes (or connections) since the last call.
+    # RESTAURANT_CHANGE is kept by triggers, an unchanged catalog costs one indexed MAX per call.
+    # Tracked per database file, shards number their changes independently (restaurant ids are unique across them)
+    database, change_id = cursor.execute("""
+    SELECT (SELECT file FROM pragma_database_list WHERE name = 'main'), COALESCE(MAX(CHANGE_ID), 0) FROM RESTAURANT_CHANGE
+    """).fetchone()
+    with _sync_lock:
+        synced = _synced_change_ids.get(database)
+        if synced == change_id:
+            return
+        _synced_change_ids[database] = change_id
+    if synced is None or change_id < synced:
+        # First sync, whatever was cached before it may have missed changes; fewer changes than seen is another database
+        restaurant_catalog.clear()
+        for listener in _invalidation_listeners:
+            listener(None)
+        return
+    changed = {}
+    for restaurant_id, location in cursor.execute("""
+    SELECT RESTAURANT_CHANGE.RESTAURANT_ID, RESTAURANT_LOCATION.LOCATION FROM RESTAURANT_CHANGE
+    LEFT JOIN RESTAURANT_LOCATION ON RESTAURANT_LOCATION.RESTAURANT_ID = RESTAURANT_CHANGE.RESTAURANT_ID
+    WHERE RESTAURANT_CHANGE.CHANGE_ID > ? AND RESTAURANT_CHANGE.CHANGE_ID <= ?
+    """, (synced, change_id)):
+        locations = changed.setdefault(restaurant_id, [])
+        if location is not None:
+            locations.append(location)
+    for restaurant_id, locations in changed.items():
+        # Locations too, a restaurant new to a location is not in any of its cached lists yet
+        invalidate_restaurant(restaurant_id, locations)
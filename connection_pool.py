@@ -0,0 +1,126 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    def __init__(
+            self,
+            database: str,
+            size: int = 5,
+            timeout: float = 5.0,
+            initializer=None,
+            on_connect=None
+    ):
+        if size <= 0:
+            raise ValueError("Connection pool size must be > 0")
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.on_connect = on_connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+        # One-time schema setup, instead of re-running the DDL for every request
+        if initializer is not None:
+            with self.cursor() as cursor:
+                initializer(cursor)
+
+    def _connect(self):
+        # Connections are handed between threads, but only one thread holds a connection at a time
+        conn = sqlite3.connect(self.database, timeout=self.timeout, check_same_thread=False)
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+
+        # Nested checkouts on the same thread reuse the connection it already holds
+        held = getattr(self._local, "connection", None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No database connection available after {self.timeout}s")
+
+        self._local.connection = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        if getattr(self._local, "connection", None) is not conn:
+            raise ValueError("Connection was not checked out by this thread")
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.connection = None
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        outermost = self._local.depth == 1
+        try:
+            yield conn
+            if outermost:
+                conn.commit()
+        except BaseException:
+            if outermost:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
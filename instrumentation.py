@@ -0,0 +1,216 @@
+import os
+import sqlite3
+import threading
+import time
+
+enabled = os.environ.get("FOODBAGS_INSTRUMENTATION", "") == "1"
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}  # stage -> [count, total_seconds, max_seconds]
+_counters = {}  # counter -> value
+_requests = {}  # request -> [count, total_seconds, sql_queries]
+_connections = set()  # sqlite3 connections cannot be weakly referenced, closed ones are pruned below
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(_stages, self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _Request:
+    __slots__ = ("name", "started", "outer_queries")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.outer_queries = getattr(_local, "sql_queries", None)
+        _local.sql_queries = 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        queries = _local.sql_queries
+        with _lock:
+            totals = _requests.get(self.name)
+            if totals is None:
+                totals = _requests[self.name] = [0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += queries
+        # A request nested in another one (e.g. a batch) also counts towards the outer request
+        _local.sql_queries = None if self.outer_queries is None else self.outer_queries + queries
+        return False
+
+
+def _record(table: dict, name: str, seconds: float):
+    with _lock:
+        totals = table.get(name)
+        if totals is None:
+            totals = table[name] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+        if seconds > totals[2]:
+            totals[2] = seconds
+
+
+def _count_statement(statement):
+    queries = getattr(_local, "sql_queries", None)
+    if queries is not None:
+        _local.sql_queries = queries + 1
+
+
+def stage(name: str):
+    # Disabled collection costs one global lookup and returns a shared no-op context manager
+    if not enabled:
+        return _NULL_CONTEXT
+    return _Stage(name)
+
+
+def request(name: str):
+    if not enabled:
+        return _NULL_CONTEXT
+    return _Request(name)
+
+
+def increment(name: str, value: int = 1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _set_trace_callbacks(callback):
+    with _lock:
+        connections = list(_connections)
+    for conn in connections:
+        try:
+            conn.set_trace_callback(callback)
+        except sqlite3.ProgrammingError:
+            with _lock:
+                _connections.discard(conn)
+
+
+def attach_connection(conn):
+    # SQL statements are only traced while instrumentation is enabled
+    with _lock:
+        _connections.add(conn)
+    if enabled:
+        conn.set_trace_callback(_count_statement)
+
+
+def enable():
+    global enabled
+    enabled = True
+    _set_trace_callbacks(_count_statement)
+
+
+def disable():
+    global enabled
+    enabled = False
+    _set_trace_callbacks(None)
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _requests.clear()
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "stages": {
+                name: {"count": count, "totalSeconds": total, "maxSeconds": maximum}
+                for name, (count, total, maximum) in _stages.items()
+            },
+            "counters": dict(_counters),
+            "requests": {
+                name: {"count": count, "totalSeconds": total, "sqlQueries": queries}
+                for name, (count, total, queries) in _requests.items()
+            },
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    data = snapshot()
+    lines = [
+        "# HELP foodbags_stage_seconds Time spent per request stage.",
+        "# TYPE foodbags_stage_seconds summary",
+    ]
+    for name, stats in sorted(data["stages"].items()):
+        label = f'stage="{_escape(name)}"'
+        lines.append(f"foodbags_stage_seconds_count{{{label}}} {stats['count']}")
+        lines.append(f"foodbags_stage_seconds_sum{{{label}}} {stats['totalSeconds']:.9f}")
+    lines += [
+        "# HELP foodbags_stage_seconds_max Slowest observation per request stage.",
+        "# TYPE foodbags_stage_seconds_max gauge",
+    ]
+    for name, stats in sorted(data["stages"].items()):
+        lines.append(f'foodbags_stage_seconds_max{{stage="{_escape(name)}"}} {stats["maxSeconds"]:.9f}')
+    lines += [
+        "# HELP foodbags_request_seconds Time spent per request.",
+        "# TYPE foodbags_request_seconds summary",
+    ]
+    for name, stats in sorted(data["requests"].items()):
+        label = f'request="{_escape(name)}"'
+        lines.append(f"foodbags_request_seconds_count{{{label}}} {stats['count']}")
+        lines.append(f"foodbags_request_seconds_sum{{{label}}} {stats['totalSeconds']:.9f}")
+    lines += [
+        "# HELP foodbags_request_sql_queries_total SQL statements executed per request type.",
+        "# TYPE foodbags_request_sql_queries_total counter",
+    ]
+    for name, stats in sorted(data["requests"].items()):
+        lines.append(f'foodbags_request_sql_queries_total{{request="{_escape(name)}"}} {stats["sqlQueries"]}')
+    lines += [
+        "# HELP foodbags_events_total Hot path counters.",
+        "# TYPE foodbags_events_total counter",
+    ]
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f'foodbags_events_total{{name="{_escape(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def start_periodic_dump(path: str, interval_seconds: float = 15.0) -> threading.Event:
+    # Rewrites path atomically every interval, set the returned event to stop
+    stopped = threading.Event()
+
+    def dump():
+        while not stopped.wait(interval_seconds):
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "w") as output:
+                output.write(render_prometheus())
+            os.replace(temporary_path, path)
+
+    threading.Thread(target=dump, name="foodbags-metrics-dump", daemon=True).start()
+    return stopped
@@ -0,0 +1,100 @@
+import sys
+import threading
+from collections import OrderedDict
+
+default_flush_size = 500
+default_flush_interval_seconds = 1.0
+default_recent_entries = 100000
+
+
+class CustomerLocationBuffer:
+    def __init__(
+            self,
+            cursor_factory,
+            flush_size: int = default_flush_size,
+            flush_interval_seconds: float = default_flush_interval_seconds,
+            recent_entries: int = default_recent_entries
+    ):
+        # cursor_factory returns a context manager yielding a cursor, e.g. a pool checkout
+        self.cursor_factory = cursor_factory
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.recent_entries = recent_entries
+        self._pending = set()  # (user_id, location) waiting for the next flush
+        self._recent = OrderedDict()  # flushed pairs, so repeated inquiries are not buffered again
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def add(self, user_id: int, location: str) -> bool:
+        pair = (user_id, location)
+        with self._lock:
+            if pair in self._pending or pair in self._recent:
+                return False
+            self._pending.add(pair)
+            full = len(self._pending) >= self.flush_size
+            if self._worker is None:
+                self._start()
+        if full:
+            # Flushing happens on the worker, the caller may be in the middle of its own transaction
+            self._wake.set()
+        return True
+
+    def pending(self, user_id: int) -> set:
+        with self._lock:
+            return {location for pending_user_id, location in self._pending if pending_user_id == user_id}
+
+    def _start(self):
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._run, name="foodbags-location-flush", daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                print(f"Customer location flush failed: {error}", file=sys.stderr)
+
+    def flush(self) -> int:
+        # Writes every pending pair in one transaction, failed pairs go back to the buffer
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = set()
+            try:
+                with self.cursor_factory() as cursor:
+                    cursor.executemany("""
+                    INSERT OR IGNORE INTO USER_LOCATION (USER_ID, LOCATION) VALUES (?, ?)
+                    """, list(batch))
+                    cursor.connection.commit()
+            except BaseException:
+                with self._lock:
+                    self._pending |= batch
+                raise
+            with self._lock:
+                for pair in batch:
+                    self._recent[pair] = None
+                while len(self._recent) > self.recent_entries:
+                    self._recent.popitem(last=False)
+            return len(batch)
+
+    def clear_recent(self):
+        with self._lock:
+            self._recent.clear()
+
+    def close(self):
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._stopped.set()
+            self._wake.set()
+            worker.join()
+        self.flush()
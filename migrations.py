@@ -0,0 +1,429 @@
+import sqlite3
+
+database_path = 'app_backend.db'
+
+# Applied to every connection; WAL lets readers keep going while a writer commits
+journal_mode = "WAL"
+synchronous = "NORMAL"  # durable at checkpoints, safe with WAL and much cheaper than FULL per commit
+cache_size_kib = 16384
+mmap_size_bytes = 64 * 1024 * 1024
+busy_timeout_seconds = 5.0
+
+
+def configure_connection(conn):
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    conn.execute(f"PRAGMA cache_size = -{cache_size_kib}")
+    conn.execute(f"PRAGMA mmap_size = {mmap_size_bytes}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def connect(database: str = None, **kwargs):
+    # The one way modules open the application database, migrated to the latest version
+    kwargs.setdefault("timeout", busy_timeout_seconds)
+    conn = sqlite3.connect(database or database_path, **kwargs)
+    configure_connection(conn)
+    migrate(conn.cursor())
+    return conn
+
+
+def add_column_if_missing(cursor, table: str, column: str, definition: str):
+    columns = {row[1].upper() for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column.upper() not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _create_restaurant_location_triggers(cursor):
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_LOCATION_INSERT AFTER INSERT ON RESTAURANT
+    BEGIN
+    INSERT OR IGNORE INTO RESTAURANT_LOCATION (LOCATION, RESTAURANT_ID)
+    SELECT value, NEW.RESTAURANT_ID FROM json_each(
+    CASE WHEN json_valid(NEW.LOCATION) THEN NEW.LOCATION ELSE json_array(NEW.LOCATION) END);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_LOCATION_UPDATE AFTER UPDATE OF RESTAURANT_ID, LOCATION ON RESTAURANT
+    BEGIN
+    DELETE FROM RESTAURANT_LOCATION WHERE RESTAURANT_ID = OLD.RESTAURANT_ID;
+    INSERT OR IGNORE INTO RESTAURANT_LOCATION (LOCATION, RESTAURANT_ID)
+    SELECT value, NEW.RESTAURANT_ID FROM json_each(
+    CASE WHEN json_valid(NEW.LOCATION) THEN NEW.LOCATION ELSE json_array(NEW.LOCATION) END);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_LOCATION_DELETE AFTER DELETE ON RESTAURANT
+    BEGIN
+    DELETE FROM RESTAURANT_LOCATION WHERE RESTAURANT_ID = OLD.RESTAURANT_ID;
+    END
+    """)
+
+
+def _create_purchase_order_indexes(cursor):
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_RESTAURANT_STATUS_INDEX ON PURCHASE_ORDER (RESTAURANT_ID, STATUS)
+    """)
+    # History pages walk these in (ORDERD_AT, PURCHASE_ORDER_ID) order
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_USER_HISTORY_INDEX ON PURCHASE_ORDER (USER_ID, ORDERD_AT, PURCHASE_ORDER_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_RESTAURANT_HISTORY_INDEX
+    ON PURCHASE_ORDER (RESTAURANT_ID, ORDERD_AT, PURCHASE_ORDER_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_STATUS_ORDERD_AT_INDEX ON PURCHASE_ORDER (STATUS, ORDERD_AT)
+    """)
+
+
+def _create_baseline_schema(cursor):
+    # Version 1, the schema as it was before migrations were versioned; every statement is idempotent
+
+    # Create User table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS USER (
+    USER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    NAME TEXT NOT NULL,
+    EMAIL TEXT NOT NULL,
+    PASSWORD TEXT NOT NULL,
+    MOBILE_NUMBER INTEGER NOT NULL,
+    LAST_USED_AT TIMESTAMP NOT NULL,
+    LOCATION TEXT)
+    """)
+
+    # Create Restaurant table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT (
+    RESTAURANT_ID INTEGER NOT NULL,
+    NAME TEXT NOT NULL,
+    LOCATION TEXT NOT NULL,
+    NUM_OF_BAGS INTEGER NOT NULL,
+    REMAINING_BAGS INTEGER NOT NULL,
+    OVERALL_RATING FLOAT,
+    OPENING_TIME TIMESTAMP NOT NULL,
+    CLOSING_TIME TIMESTAMP NOT NULL,
+    LATITUDE FLOAT,
+    LONGITUDE FLOAT)
+    """)
+    add_column_if_missing(cursor, "RESTAURANT", "LATITUDE", "FLOAT")
+    add_column_if_missing(cursor, "RESTAURANT", "LONGITUDE", "FLOAT")
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS RESTAURANT_ID_INDEX ON RESTAURANT (RESTAURANT_ID)
+    """)
+
+    # Create Restaurant location mapping table, kept in sync with RESTAURANT.LOCATION by triggers
+    backfill_locations = cursor.execute("""
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'RESTAURANT_LOCATION'
+    """).fetchone() is None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT_LOCATION (
+    LOCATION TEXT NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    PRIMARY KEY (LOCATION, RESTAURANT_ID)) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS RESTAURANT_LOCATION_RESTAURANT_ID_INDEX ON RESTAURANT_LOCATION (RESTAURANT_ID)
+    """)
+    _create_restaurant_location_triggers(cursor)
+    if backfill_locations:
+        cursor.execute("""
+        INSERT OR IGNORE INTO RESTAURANT_LOCATION (LOCATION, RESTAURANT_ID)
+        SELECT LOCATIONS.value, RESTAURANT.RESTAURANT_ID FROM RESTAURANT, json_each(
+        CASE WHEN json_valid(RESTAURANT.LOCATION) THEN RESTAURANT.LOCATION ELSE json_array(RESTAURANT.LOCATION) END
+        ) AS LOCATIONS
+        """)
+
+    # Create User location table, one row per customer location instead of the USER.LOCATION JSON list
+    backfill_user_locations = cursor.execute("""
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'USER_LOCATION'
+    """).fetchone() is None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS USER_LOCATION (
+    USER_ID INTEGER NOT NULL,
+    LOCATION TEXT NOT NULL,
+    PRIMARY KEY (USER_ID, LOCATION)) WITHOUT ROWID
+    """)
+    if backfill_user_locations:
+        cursor.execute("""
+        INSERT OR IGNORE INTO USER_LOCATION (USER_ID, LOCATION)
+        SELECT USER.USER_ID, LOCATIONS.value FROM USER, json_each(
+        CASE WHEN json_valid(USER.LOCATION) THEN USER.LOCATION ELSE json_array(USER.LOCATION) END
+        ) AS LOCATIONS WHERE USER.LOCATION IS NOT NULL
+        """)
+
+    # Create Purchase order table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS PURCHASE_ORDER (
+    PURCHASE_ORDER_ID INTEGER NOT NULL,
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    NUM_OF_BAGS INTEGER NOT NULL,
+    LOCATION TEXT NOT NULL,
+    ORDERD_AT TIMESTAMP NOT NULL,
+    STATUS INTEGER NOT NULL)
+    """)
+    # Order ids are unique in practice, the index makes lookups by id and the archive move cheap
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS PURCHASE_ORDER_ID_INDEX ON PURCHASE_ORDER (PURCHASE_ORDER_ID)
+    """)
+    _create_purchase_order_indexes(cursor)
+
+    # Create Purchase order archive table, completed and canceled orders past the retention window
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS PURCHASE_ORDER_ARCHIVE (
+    PURCHASE_ORDER_ID INTEGER NOT NULL PRIMARY KEY,
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    NUM_OF_BAGS INTEGER NOT NULL,
+    LOCATION TEXT NOT NULL,
+    ORDERD_AT TIMESTAMP NOT NULL,
+    STATUS INTEGER NOT NULL)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_ARCHIVE_USER_HISTORY_INDEX
+    ON PURCHASE_ORDER_ARCHIVE (USER_ID, ORDERD_AT, PURCHASE_ORDER_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS PURCHASE_ORDER_ARCHIVE_RESTAURANT_HISTORY_INDEX
+    ON PURCHASE_ORDER_ARCHIVE (RESTAURANT_ID, ORDERD_AT, PURCHASE_ORDER_ID)
+    """)
+
+    # Create User Rating table
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS USER_RATING (
+    ID INTEGER NOT NULL,
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    RATING FLOAT NOT NULL)
+    """)
+
+    # Create Customer Ratings table, written by the rating module
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CUSTOMER_RATINGS (
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    RATING FLOAT NOT NULL,
+    UPDATED_AT TIMESTAMP NOT NULL,
+    PRIMARY KEY (USER_ID, RESTAURANT_ID))
+    """)
+
+    # Create Restaurant rating aggregate table, running sum and count behind OVERALL_RATING
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT_RATING_AGGREGATE (
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    RATING_SUM FLOAT NOT NULL,
+    RATING_COUNT INTEGER NOT NULL)
+    """)
+
+
+def _require_unique(cursor, table: str, column: str):
+    duplicates = cursor.execute(f"""
+    SELECT {column}, COUNT(*) FROM {table} GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 10
+    """).fetchall()
+    if duplicates:
+        values = ", ".join(repr(value) for value, _ in duplicates)
+        raise ValueError(f"Duplicate {table}.{column} values must be resolved before migrating: {values}")
+
+
+def _rebuild_table(cursor, table: str, definition: str, columns: str):
+    # SQLite cannot add a primary key in place: copy into a new table and swap it in
+    cursor.execute(f"CREATE TABLE {table}_MIGRATION ({definition})")
+    cursor.execute(f"INSERT INTO {table}_MIGRATION ({columns}) SELECT {columns} FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_MIGRATION RENAME TO {table}")
+
+
+def _add_keys_and_indexes(cursor):
+    # Version 2, primary keys on the tables created without one, unique emails and foreign key indexes
+    _require_unique(cursor, "RESTAURANT", "RESTAURANT_ID")
+    _require_unique(cursor, "PURCHASE_ORDER", "PURCHASE_ORDER_ID")
+    _require_unique(cursor, "USER_RATING", "ID")
+    _require_unique(cursor, "USER", "EMAIL")
+
+    _rebuild_table(cursor, "RESTAURANT", """
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    NAME TEXT NOT NULL,
+    LOCATION TEXT NOT NULL,
+    NUM_OF_BAGS INTEGER NOT NULL,
+    REMAINING_BAGS INTEGER NOT NULL,
+    OVERALL_RATING FLOAT,
+    OPENING_TIME TIMESTAMP NOT NULL,
+    CLOSING_TIME TIMESTAMP NOT NULL,
+    LATITUDE FLOAT,
+    LONGITUDE FLOAT
+    """, "RESTAURANT_ID, NAME, LOCATION, NUM_OF_BAGS, REMAINING_BAGS, OVERALL_RATING, "
+         "OPENING_TIME, CLOSING_TIME, LATITUDE, LONGITUDE")
+    # Dropping the old table dropped its triggers, RESTAURANT_LOCATION already holds the copied rows
+    _create_restaurant_location_triggers(cursor)
+
+    _rebuild_table(cursor, "PURCHASE_ORDER", """
+    PURCHASE_ORDER_ID INTEGER PRIMARY KEY,
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    NUM_OF_BAGS INTEGER NOT NULL,
+    LOCATION TEXT NOT NULL,
+    ORDERD_AT TIMESTAMP NOT NULL,
+    STATUS INTEGER NOT NULL
+    """, "PURCHASE_ORDER_ID, USER_ID, RESTAURANT_ID, NUM_OF_BAGS, LOCATION, ORDERD_AT, STATUS")
+    _create_purchase_order_indexes(cursor)
+
+    _rebuild_table(cursor, "USER_RATING", """
+    ID INTEGER PRIMARY KEY,
+    USER_ID INTEGER NOT NULL,
+    RESTAURANT_ID INTEGER NOT NULL,
+    RATING FLOAT NOT NULL
+    """, "ID, USER_ID, RESTAURANT_ID, RATING")
+
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS USER_EMAIL_INDEX ON USER (EMAIL)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS USER_RATING_USER_ID_INDEX ON USER_RATING (USER_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS USER_RATING_RESTAURANT_ID_INDEX ON USER_RATING (RESTAURANT_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS CUSTOMER_RATINGS_RESTAURANT_ID_INDEX ON CUSTOMER_RATINGS (RESTAURANT_ID)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS USER_MOBILE_NUMBER_INDEX ON USER (MOBILE_NUMBER)
+    """)
+
+
+def _add_bag_ledger(cursor):
+    # Version 3, append-only bag deltas plus per-restaurant snapshots to replay them from
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS BAG_LEDGER (
+    EVENT_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    RESTAURANT_ID INTEGER NOT NULL,
+    DELTA INTEGER NOT NULL,
+    REASON TEXT NOT NULL,
+    REFERENCE_ID INTEGER,
+    CREATED_AT TIMESTAMP NOT NULL)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS BAG_LEDGER_RESTAURANT_EVENT_INDEX ON BAG_LEDGER (RESTAURANT_ID, EVENT_ID)
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS BAG_SNAPSHOT (
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    REMAINING_BAGS INTEGER NOT NULL,
+    LAST_EVENT_ID INTEGER NOT NULL,
+    TAKEN_AT TIMESTAMP NOT NULL)
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO BAG_SNAPSHOT (RESTAURANT_ID, REMAINING_BAGS, LAST_EVENT_ID, TAKEN_AT)
+    SELECT RESTAURANT_ID, REMAINING_BAGS, 0, datetime('now') FROM RESTAURANT
+    """)
+    # New restaurants start with a snapshot of their initial count, after every event already in the ledger
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS BAG_SNAPSHOT_INSERT AFTER INSERT ON RESTAURANT
+    BEGIN
+    INSERT OR REPLACE INTO BAG_SNAPSHOT (RESTAURANT_ID, REMAINING_BAGS, LAST_EVENT_ID, TAKEN_AT)
+    VALUES (NEW.RESTAURANT_ID, NEW.REMAINING_BAGS, (SELECT COALESCE(MAX(EVENT_ID), 0) FROM BAG_LEDGER), datetime('now'));
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS BAG_SNAPSHOT_DELETE AFTER DELETE ON RESTAURANT
+    BEGIN
+    DELETE FROM BAG_SNAPSHOT WHERE RESTAURANT_ID = OLD.RESTAURANT_ID;
+    END
+    """)
+
+
+def _add_replenishment_state(cursor):
+    # Version 4, the opening each restaurant was last restocked for
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT_REPLENISHMENT (
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    LAST_REPLENISHED_AT TIMESTAMP NOT NULL)
+    """)
+
+
+def _add_shard_directory(cursor):
+    # Version 5, which shard database holds each restaurant and which shards serve each location
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT_SHARD (
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    SHARD TEXT NOT NULL)
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS LOCATION_SHARD (
+    LOCATION TEXT NOT NULL,
+    SHARD TEXT NOT NULL,
+    PRIMARY KEY (LOCATION, SHARD)) WITHOUT ROWID
+    """)
+
+
+def _add_restaurant_change_log(cursor):
+    # Version 6, the latest change of every restaurant, so in-memory indexes also see other processes' writes
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS RESTAURANT_CHANGE (
+    RESTAURANT_ID INTEGER PRIMARY KEY,
+    CHANGE_ID INTEGER NOT NULL)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS RESTAURANT_CHANGE_ID_INDEX ON RESTAURANT_CHANGE (CHANGE_ID)
+    """)
+    # Writers are serialized, so MAX + 1 is unique and commits make change ids visible in order
+    record_change = """
+    INSERT OR REPLACE INTO RESTAURANT_CHANGE (RESTAURANT_ID, CHANGE_ID)
+    SELECT {row}.RESTAURANT_ID, (SELECT COALESCE(MAX(CHANGE_ID), 0) + 1 FROM RESTAURANT_CHANGE) {where};
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_CHANGE_INSERT AFTER INSERT ON RESTAURANT
+    BEGIN
+    {record_change.format(row="NEW", where="")}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_CHANGE_UPDATE AFTER UPDATE ON RESTAURANT
+    BEGIN
+    {record_change.format(row="NEW", where="")}
+    {record_change.format(row="OLD", where="WHERE OLD.RESTAURANT_ID IS NOT NEW.RESTAURANT_ID")}
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS RESTAURANT_CHANGE_DELETE AFTER DELETE ON RESTAURANT
+    BEGIN
+    {record_change.format(row="OLD", where="")}
+    END
+    """)
+
+
+# Append only: version n is MIGRATIONS[n - 1], never edit one that has shipped
+MIGRATIONS = [
+    _create_baseline_schema,
+    _add_keys_and_indexes,
+    _add_bag_ledger,
+    _add_replenishment_state,
+    _add_shard_directory,
+    _add_restaurant_change_log,
+]
+
+
+def schema_version(cursor) -> int:
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(cursor):
+    conn = cursor.connection
+    if schema_version(cursor) >= len(MIGRATIONS):
+        return
+    if conn.in_transaction:
+        conn.commit()
+    # One migration per transaction; the write lock makes concurrent processes take turns
+    while True:
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(cursor)
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            MIGRATIONS[version](cursor)
+            cursor.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
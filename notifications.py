@@ -0,0 +1,135 @@
+import json
+import queue
+import sys
+import threading
+import time
+
+import instrumentation
+
+default_workers = 2
+default_batch_size = 100
+default_max_attempts = 3
+default_retry_backoff_seconds = 0.5
+
+
+class PrintNotificationSink:
+    def deliver(self, notifications: list):
+        for notification in notifications:
+            print(f"Restaurant '{notification['restaurantId']}' canceled, "
+                  f"notifying {notification['email'] or notification['mobileNumber']} "
+                  f"about order {notification['purchaseOrderId']}")
+
+
+class FileNotificationSink:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, notifications: list):
+        lines = "".join(json.dumps(notification) + "\n" for notification in notifications)
+        with self._lock, open(self.path, "a") as output:
+            output.write(lines)
+
+
+class InMemoryNotificationSink:
+    def __init__(self):
+        self.delivered = []
+        self._lock = threading.Lock()
+
+    def deliver(self, notifications: list):
+        with self._lock:
+            self.delivered.extend(notifications)
+
+
+class NotificationDispatcher:
+    def __init__(
+            self,
+            sink,
+            workers: int = default_workers,
+            batch_size: int = default_batch_size,
+            max_attempts: int = default_max_attempts,
+            retry_backoff_seconds: float = default_retry_backoff_seconds
+    ):
+        if workers <= 0:
+            raise ValueError("Notification workers must be > 0")
+        self.sink = sink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.failed = []  # notifications given up on after max_attempts
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"foodbags-notifications-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, notifications: list):
+        # Returns immediately, delivery happens on the worker threads
+        if not notifications:
+            return
+        self._start()
+        for notification in notifications:
+            self._queue.put(notification)
+        instrumentation.increment("notification_enqueued", len(notifications))
+
+    def _run(self):
+        while True:
+            notification = self._queue.get()
+            if notification is None:
+                self._queue.task_done()
+                return
+            batch = [notification]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    notification = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if notification is None:
+                    # Deliver what was drained first, then stop
+                    stop = True
+                    self._queue.task_done()
+                    break
+                batch.append(notification)
+            self._deliver(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _deliver(self, batch: list):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.sink.deliver(batch)
+                instrumentation.increment("notification_delivered", len(batch))
+                return
+            except Exception as error:
+                if attempt == self.max_attempts:
+                    print(f"Notification delivery failed after {attempt} attempts: {error}", file=sys.stderr)
+                    instrumentation.increment("notification_failed", len(batch))
+                    with self._lock:
+                        self.failed.extend(batch)
+                    return
+                instrumentation.increment("notification_retried")
+                time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+
+    def join(self):
+        # Blocks until every enqueued notification was delivered or given up on
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            threads = self._threads
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,140 @@
+import bisect
+from datetime import datetime
+
+from restaurant_index import RestaurantIndex, fetch_in_chunks
+
+MINUTES_PER_DAY = 24 * 60
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p")
+
+
+def minute_of_day(value):
+    # OPENING_TIME / CLOSING_TIME come as ISO timestamps (seed, generator), HH:MM or HH:MM AM/PM (intake scripts)
+    if isinstance(value, datetime):
+        return value.hour * 60 + value.minute
+    text = str(value).strip()
+    for time_format in TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(text, time_format)
+            return parsed.hour * 60 + parsed.minute
+        except ValueError:
+            pass
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r}")
+    return parsed.hour * 60 + parsed.minute
+
+
+def parse_open_at(value):
+    # "now", a time of day or a timestamp, as minute of the day
+    if value == "now":
+        return minute_of_day(datetime.now())
+    return minute_of_day(value)
+
+
+def open_intervals(opening_time, closing_time) -> tuple:
+    # Half-open [start, end) minute ranges, hours that cross midnight split in two
+    opening = minute_of_day(opening_time)
+    closing = minute_of_day(closing_time)
+    if opening == closing:
+        return ((0, MINUTES_PER_DAY),)
+    if closing < opening:
+        # Closing at midnight exactly leaves nothing for the next day
+        return ((opening, MINUTES_PER_DAY), (0, closing)) if closing else ((opening, MINUTES_PER_DAY),)
+    return ((opening, closing),)
+
+
+class OpeningHoursIndex(RestaurantIndex):
+    def __init__(self):
+        super().__init__()
+        self._hours = {}  # restaurant_id -> (intervals, locations)
+        self._members = {}  # location -> set of restaurant ids
+        self._timelines = {}  # location -> (boundaries, open restaurant ids per segment), built on first query
+
+    def _put(self, restaurant_id, opening_time, closing_time, locations):
+        self._remove(restaurant_id)
+        try:
+            intervals = open_intervals(opening_time, closing_time)
+        except ValueError:
+            # Unparseable hours are treated as closed instead of failing every inquiry of the location
+            intervals = ()
+        self._hours[restaurant_id] = (intervals, locations)
+        for location in locations:
+            self._members.setdefault(location, set()).add(restaurant_id)
+            self._timelines.pop(location, None)
+
+    def _remove(self, restaurant_id):
+        entry = self._hours.pop(restaurant_id, None)
+        if entry is None:
+            return
+        for location in entry[1]:
+            members = self._members[location]
+            members.discard(restaurant_id)
+            if not members:
+                del self._members[location]
+            self._timelines.pop(location, None)
+
+    def _clear(self):
+        self._hours.clear()
+        self._members.clear()
+        self._timelines.clear()
+
+    def _load(self, cursor, restaurant_ids=None):
+        query = """
+        SELECT RESTAURANT_LOCATION.LOCATION, RESTAURANT.RESTAURANT_ID, RESTAURANT.OPENING_TIME, RESTAURANT.CLOSING_TIME
+        FROM RESTAURANT_LOCATION
+        JOIN RESTAURANT ON RESTAURANT.RESTAURANT_ID = RESTAURANT_LOCATION.RESTAURANT_ID
+        """
+        if restaurant_ids is None:
+            found = cursor.execute(query).fetchall()
+        else:
+            found = fetch_in_chunks(cursor, query + " WHERE RESTAURANT.RESTAURANT_ID IN ({placeholders})", restaurant_ids)
+        rows = {}
+        for location, restaurant_id, opening_time, closing_time in found:
+            if restaurant_id not in rows:
+                rows[restaurant_id] = (opening_time, closing_time, [])
+            rows[restaurant_id][2].append(location)
+        for restaurant_id, (opening_time, closing_time, locations) in rows.items():
+            self._put(restaurant_id, opening_time, closing_time, locations)
+
+    def _timeline(self, location):
+        # Sorted interval boundaries of the location and, per segment between them, who is open
+        timeline = self._timelines.get(location)
+        if timeline is not None:
+            return timeline
+        intervals = [
+            (restaurant_id, start, end)
+            for restaurant_id in self._members.get(location, ())
+            for start, end in self._hours[restaurant_id][0]
+        ]
+        boundaries = {0}
+        for _, start, end in intervals:
+            boundaries.add(start)
+            if end < MINUTES_PER_DAY:
+                boundaries.add(end)
+        boundaries = sorted(boundaries)
+        opening = [set() for _ in boundaries]
+        closing = [set() for _ in boundaries]
+        for restaurant_id, start, end in intervals:
+            opening[bisect.bisect_left(boundaries, start)].add(restaurant_id)
+            if end < MINUTES_PER_DAY:
+                closing[bisect.bisect_left(boundaries, end)].add(restaurant_id)
+        segments = []
+        open_now = set()
+        for index in range(len(boundaries)):
+            open_now = (open_now - closing[index]) | opening[index]
+            segments.append(frozenset(open_now))
+        timeline = self._timelines[location] = (boundaries, segments)
+        return timeline
+
+    def open_restaurants(self, location: str, minute: int) -> frozenset:
+        with self._lock:
+            boundaries, segments = self._timeline(location)
+            return segments[bisect.bisect_right(boundaries, minute) - 1]
+
+    def is_open(self, restaurant_id, minute: int) -> bool:
+        with self._lock:
+            entry = self._hours.get(restaurant_id)
+            if entry is None:
+                return False
+            return any(start <= minute < end for start, end in entry[0])
@@ -0,0 +1,94 @@
+import argparse
+from datetime import datetime, timedelta
+
+from CustomerInquiryAndDataModels import PurchaseStatus, get_connection_pool, mapped_cursor, purchase_order_row_factory
+
+default_page_size = 50
+max_page_size = 500
+default_retention_days = 90
+default_archive_batch_size = 5000
+
+PURCHASE_ORDER_COLUMNS = "PURCHASE_ORDER_ID, USER_ID, RESTAURANT_ID, NUM_OF_BAGS, LOCATION, ORDERD_AT, STATUS"
+ARCHIVED_STATUSES = (PurchaseStatus.COMPLETED.value, PurchaseStatus.CANCELED.value)
+
+
+def get_purchase_order(cursor, order_id: int):
+    # Hot table first, archived orders are still found by id
+    order_cursor = mapped_cursor(cursor, purchase_order_row_factory)
+    for table in ("PURCHASE_ORDER", "PURCHASE_ORDER_ARCHIVE"):
+        order = order_cursor.execute(
+            f"SELECT {PURCHASE_ORDER_COLUMNS} FROM {table} WHERE PURCHASE_ORDER_ID = ?", (order_id,)
+        ).fetchone()
+        if order is not None:
+            return order
+    return None
+
+
+def _history_page(cursor, column: str, value: int, limit: int, after, archived: bool) -> dict:
+    if limit <= 0 or limit > max_page_size:
+        raise ValueError(f"Page size must be between 1 and {max_page_size}")
+    table = "PURCHASE_ORDER_ARCHIVE" if archived else "PURCHASE_ORDER"
+    # Keyset pagination, newest first: the page starts right after the last (ORDERD_AT, PURCHASE_ORDER_ID) seen
+    query = f"SELECT {PURCHASE_ORDER_COLUMNS} FROM {table} WHERE {column} = ?"
+    params = [value]
+    if after is not None:
+        query += " AND (ORDERD_AT, PURCHASE_ORDER_ID) < (?, ?)"
+        params += list(after)
+    query += " ORDER BY ORDERD_AT DESC, PURCHASE_ORDER_ID DESC LIMIT ?"
+    params.append(limit + 1)
+    orders = mapped_cursor(cursor, purchase_order_row_factory).execute(query, params).fetchall()
+    next_page = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_page = (orders[-1].ordered_at, orders[-1].id)
+    return {"orders": orders, "nextPage": next_page}
+
+
+def customer_order_history(cursor, user_id: int, limit: int = default_page_size, after=None, archived: bool = False):
+    # Pass the previous page's nextPage as after to continue
+    return _history_page(cursor, "USER_ID", user_id, limit, after, archived)
+
+
+def restaurant_order_history(cursor, restaurant_id: int, limit: int = default_page_size, after=None, archived: bool = False):
+    return _history_page(cursor, "RESTAURANT_ID", restaurant_id, limit, after, archived)
+
+
+def archive_purchase_orders(
+        cursor,
+        retention_days: int = default_retention_days,
+        now: datetime = None,
+        batch_size: int = default_archive_batch_size
+) -> int:
+    # Moves completed and canceled orders older than the window, one short transaction per batch
+    cutoff = ((now or datetime.now()) - timedelta(days=retention_days)).isoformat()
+    placeholders = ", ".join("?" * len(ARCHIVED_STATUSES))
+    archived = 0
+    while True:
+        orders = cursor.execute(f"""
+        DELETE FROM PURCHASE_ORDER WHERE rowid IN (
+        SELECT rowid FROM PURCHASE_ORDER WHERE STATUS IN ({placeholders}) AND ORDERD_AT < ? LIMIT ?)
+        RETURNING {PURCHASE_ORDER_COLUMNS}
+        """, (*ARCHIVED_STATUSES, cutoff, batch_size)).fetchall()
+        if not orders:
+            break
+        cursor.executemany(f"""
+        INSERT OR REPLACE INTO PURCHASE_ORDER_ARCHIVE ({PURCHASE_ORDER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, orders)
+        cursor.connection.commit()
+        archived += len(orders)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed and canceled purchase orders to the archive")
+    parser.add_argument("--retention-days", type=int, default=default_retention_days)
+    parser.add_argument("--batch-size", type=int, default=default_archive_batch_size)
+    args = parser.parse_args()
+
+    with get_connection_pool().cursor() as cursor:
+        archived = archive_purchase_orders(cursor, args.retention_days, batch_size=args.batch_size)
+    print(f"Archived {archived} purchase order(s) older than {args.retention_days} days")
+
+
+if __name__ == "__main__":
+    main()
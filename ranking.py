@@ -0,0 +1,80 @@
+import bisect
+import math
+
+from restaurant_index import RestaurantIndex, fetch_in_chunks
+
+rating_weight = 1.0
+remaining_bags_weight = 0.5
+
+
+def ranking_score(overall_rating: float, remaining_bags: int) -> float:
+    # Rating dominates, bags break ties with diminishing returns so a big stock cannot outrank a bad rating
+    return rating_weight * (overall_rating or 0.0) + remaining_bags_weight * math.log1p(max(remaining_bags, 0))
+
+
+class RestaurantRanking(RestaurantIndex):
+    def __init__(self):
+        super().__init__()
+        self._ranked = {}  # location -> sorted list of (-score, restaurant_id)
+        self._entries = {}  # restaurant_id -> (score, name, remaining_bags, locations)
+
+    def _put(self, restaurant_id, name, remaining_bags, overall_rating, locations):
+        self._remove(restaurant_id)
+        if remaining_bags <= 0:
+            # Sold out restaurants are left out until a cancellation or replenishment puts bags back
+            return
+        score = ranking_score(overall_rating, remaining_bags)
+        self._entries[restaurant_id] = (score, name, remaining_bags, locations)
+        for location in locations:
+            bisect.insort(self._ranked.setdefault(location, []), (-score, restaurant_id))
+
+    def _remove(self, restaurant_id):
+        entry = self._entries.pop(restaurant_id, None)
+        if entry is None:
+            return
+        key = (-entry[0], restaurant_id)
+        for location in entry[3]:
+            ranked = self._ranked[location]
+            del ranked[bisect.bisect_left(ranked, key)]
+            if not ranked:
+                del self._ranked[location]
+
+    def _clear(self):
+        self._ranked.clear()
+        self._entries.clear()
+
+    def _load(self, cursor, restaurant_ids=None):
+        query = """
+        SELECT RESTAURANT_LOCATION.LOCATION, RESTAURANT.RESTAURANT_ID, RESTAURANT.NAME,
+        RESTAURANT.REMAINING_BAGS, RESTAURANT.OVERALL_RATING
+        FROM RESTAURANT_LOCATION
+        JOIN RESTAURANT ON RESTAURANT.RESTAURANT_ID = RESTAURANT_LOCATION.RESTAURANT_ID
+        """
+        if restaurant_ids is None:
+            found = cursor.execute(query).fetchall()
+        else:
+            found = fetch_in_chunks(cursor, query + " WHERE RESTAURANT.RESTAURANT_ID IN ({placeholders})", restaurant_ids)
+        rows = {}
+        for location, restaurant_id, name, remaining_bags, overall_rating in found:
+            if restaurant_id not in rows:
+                rows[restaurant_id] = (name, remaining_bags, overall_rating, [])
+            rows[restaurant_id][3].append(location)
+        for restaurant_id, (name, remaining_bags, overall_rating, locations) in rows.items():
+            self._put(restaurant_id, name, remaining_bags, overall_rating, locations)
+
+    def top(self, location: str, k: int, accept=None):
+        # [(restaurant_id, name, remaining_bags)] best first, without scanning the location's candidates
+        # accept runs under the index lock, so it must be a plain lookup (e.g. a frozenset's __contains__)
+        with self._lock:
+            result = []
+            ranked = self._ranked.get(location, [])
+            if accept is None:
+                ranked = ranked[:k]
+            for _, restaurant_id in ranked:
+                if len(result) == k:
+                    break
+                if accept is not None and not accept(restaurant_id):
+                    continue
+                _, name, remaining_bags, _ = self._entries[restaurant_id]
+                result.append((restaurant_id, name, remaining_bags))
+            return result
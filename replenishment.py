@@ -0,0 +1,237 @@
+import argparse
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bag_inventory import record_bag_event
+from catalog_cache import add_invalidation_listener, invalidate_restaurant, sync_restaurant_changes
+from CustomerInquiryAndDataModels import get_connection_pool
+from opening_hours import minute_of_day
+from restaurant_index import RestaurantIndex, fetch_in_chunks
+import instrumentation
+
+default_window_minutes = 5
+default_interval_seconds = 60.0
+
+
+class SimulatedClock:
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def __call__(self) -> datetime:
+        return self.current
+
+    def advance(self, delta: timedelta):
+        self.current += delta
+
+
+def latest_opening(opening_minute: int, now: datetime) -> datetime:
+    # The most recent opening at or before now, in server local time like the rest of the backend
+    opening = datetime.combine(now.date(), datetime.min.time()) + timedelta(minutes=opening_minute)
+    return opening if opening <= now else opening - timedelta(days=1)
+
+
+def next_opening(opening_minute: int, after: datetime) -> datetime:
+    opening = datetime.combine(after.date(), datetime.min.time()) + timedelta(minutes=opening_minute)
+    return opening if opening > after else opening + timedelta(days=1)
+
+
+class ReplenishmentScheduler(RestaurantIndex):
+    def __init__(self, clock=datetime.now, window_minutes: int = default_window_minutes):
+        super().__init__()
+        self.clock = clock
+        self.window_minutes = window_minutes
+        self._opening = {}  # restaurant_id -> opening minute of the day
+        self._last = {}  # restaurant_id -> opening it was last replenished for
+        self._next = {}  # restaurant_id -> next opening due, heap entries that disagree are stale
+        self._heap = []
+        self._queued = set()  # (due, restaurant_id) in the heap, so re-reading an unchanged restaurant pushes nothing
+        self._now = None  # the refresh's clock reading, for restaurants seen for the first time
+
+    def _schedule(self, restaurant_id, opening_time, last_replenished, now, new_records):
+        try:
+            opening_minute = minute_of_day(opening_time)
+        except ValueError:
+            # Unparseable opening times are never replenished automatically
+            self._forget(restaurant_id)
+            return
+        if last_replenished is None:
+            # First time the scheduler sees the restaurant: treat today's opening as done, its stock is current
+            last_replenished = latest_opening(opening_minute, now)
+            new_records.append((restaurant_id, last_replenished.isoformat()))
+        elif not isinstance(last_replenished, datetime):
+            last_replenished = datetime.fromisoformat(last_replenished)
+        self._opening[restaurant_id] = opening_minute
+        self._last[restaurant_id] = last_replenished
+        due = next_opening(opening_minute, last_replenished)
+        self._next[restaurant_id] = due
+        self._push(due, restaurant_id)
+
+    def _push(self, due, restaurant_id):
+        # Every purchase marks its restaurant dirty, the heap only grows when an opening actually moves
+        if (due, restaurant_id) not in self._queued:
+            self._queued.add((due, restaurant_id))
+            heapq.heappush(self._heap, (due, restaurant_id))
+
+    def _forget(self, restaurant_id):
+        self._opening.pop(restaurant_id, None)
+        self._last.pop(restaurant_id, None)
+        self._next.pop(restaurant_id, None)
+
+    def _remove(self, restaurant_id):
+        self._forget(restaurant_id)
+
+    def _clear(self):
+        self._opening.clear()
+        self._last.clear()
+        self._next.clear()
+        self._heap.clear()
+        self._queued.clear()
+
+    def _load(self, cursor, restaurant_ids=None):
+        query = """
+        SELECT RESTAURANT.RESTAURANT_ID, RESTAURANT.OPENING_TIME, RESTAURANT_REPLENISHMENT.LAST_REPLENISHED_AT
+        FROM RESTAURANT
+        LEFT JOIN RESTAURANT_REPLENISHMENT ON RESTAURANT_REPLENISHMENT.RESTAURANT_ID = RESTAURANT.RESTAURANT_ID
+        """
+        if restaurant_ids is None:
+            found = cursor.execute(query).fetchall()
+        else:
+            found = fetch_in_chunks(cursor, query + " WHERE RESTAURANT.RESTAURANT_ID IN ({placeholders})", restaurant_ids)
+        new_records = []
+        for restaurant_id, opening_time, last_replenished in found:
+            self._schedule(restaurant_id, opening_time, last_replenished, self._now, new_records)
+        if new_records:
+            cursor.executemany("""
+            INSERT OR IGNORE INTO RESTAURANT_REPLENISHMENT (RESTAURANT_ID, LAST_REPLENISHED_AT) VALUES (?, ?)
+            """, new_records)
+            cursor.connection.commit()
+
+    def refresh(self, cursor, now: datetime = None):
+        sync_restaurant_changes(cursor)
+        with self._lock:
+            self._now = now or self.clock()
+            self._apply_changes(cursor)
+
+    def _pop_due(self, now: datetime) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, restaurant_id = heapq.heappop(self._heap)
+            self._queued.discard((due_at, restaurant_id))
+            if self._next.get(restaurant_id) == due_at:
+                # Claimed, so a duplicate heap entry for the same opening is skipped as stale
+                self._next[restaurant_id] = None
+                due.append((due_at, restaurant_id))
+        return due
+
+    def _window(self, due_at: datetime) -> datetime:
+        minutes = (due_at.hour * 60 + due_at.minute) // self.window_minutes * self.window_minutes
+        return datetime.combine(due_at.date(), datetime.min.time()) + timedelta(minutes=minutes)
+
+    def _replenish(self, cursor, restaurant_ids: list, now: datetime):
+        # One transaction for the whole window
+        conn = cursor.connection
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        stock = fetch_in_chunks(
+            cursor, "SELECT RESTAURANT_ID, REMAINING_BAGS, NUM_OF_BAGS FROM RESTAURANT WHERE RESTAURANT_ID IN ({placeholders})",
+            restaurant_ids
+        )
+        changed = [(restaurant_id, num_of_bags - remaining_bags, num_of_bags)
+                   for restaurant_id, remaining_bags, num_of_bags in stock if num_of_bags != remaining_bags]
+        cursor.executemany(
+            "UPDATE RESTAURANT SET REMAINING_BAGS = REMAINING_BAGS + ? WHERE RESTAURANT_ID = ?",
+            [(delta, restaurant_id) for restaurant_id, delta, _ in changed]
+        )
+        for restaurant_id, delta, num_of_bags in changed:
+            record_bag_event(cursor, restaurant_id, delta, num_of_bags, "replenish")
+        # Catch-up replenishes once, for the latest opening, however many openings were missed
+        cursor.executemany("""
+        INSERT INTO RESTAURANT_REPLENISHMENT (RESTAURANT_ID, LAST_REPLENISHED_AT) VALUES (?, ?)
+        ON CONFLICT (RESTAURANT_ID) DO UPDATE SET LAST_REPLENISHED_AT = excluded.LAST_REPLENISHED_AT
+        """, [
+            (restaurant_id, latest_opening(self._opening[restaurant_id], now).isoformat())
+            for restaurant_id in restaurant_ids
+        ])
+        conn.commit()
+
+    def run_due(self, cursor) -> int:
+        now = self.clock()
+        sync_restaurant_changes(cursor)
+        with self._lock:
+            self._now = now
+            self._apply_changes(cursor)
+            due = self._pop_due(now)
+            windows = {}
+            for due_at, restaurant_id in due:
+                windows.setdefault(self._window(due_at), []).append(restaurant_id)
+            replenished = 0
+            for window in sorted(windows):
+                restaurant_ids = windows[window]
+                try:
+                    self._replenish(cursor, restaurant_ids, now)
+                except BaseException:
+                    cursor.connection.rollback()
+                    # Everything not replenished yet stays due for the next run
+                    for due_at, restaurant_id in due:
+                        if restaurant_id in self._next and self._next[restaurant_id] is None:
+                            self._next[restaurant_id] = due_at
+                            self._push(due_at, restaurant_id)
+                    raise
+                for restaurant_id in restaurant_ids:
+                    last = latest_opening(self._opening[restaurant_id], now)
+                    self._last[restaurant_id] = last
+                    self._next[restaurant_id] = next_opening(self._opening[restaurant_id], last)
+                    self._push(self._next[restaurant_id], restaurant_id)
+                replenished += len(restaurant_ids)
+        if replenished:
+            instrumentation.increment("restaurants_replenished", replenished)
+            for _, restaurant_id in due:
+                invalidate_restaurant(restaurant_id)
+        return replenished
+
+    def start(self, cursor_factory, interval_seconds: float = default_interval_seconds) -> threading.Event:
+        # Runs run_due every interval on a daemon thread, set the returned event to stop
+        stopped = threading.Event()
+
+        def run():
+            while not stopped.wait(interval_seconds):
+                with cursor_factory() as cursor:
+                    self.run_due(cursor)
+
+        threading.Thread(target=run, name="foodbags-replenishment", daemon=True).start()
+        return stopped
+
+
+replenishment_scheduler = ReplenishmentScheduler()
+add_invalidation_listener(replenishment_scheduler.invalidate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reset remaining bags to the daily capacity at opening time")
+    parser.add_argument("--once", action="store_true", help="replenish what is due (including missed days) and exit")
+    parser.add_argument("--interval", type=float, default=default_interval_seconds)
+    parser.add_argument("--shards", metavar="DIRECTORY", help="replenish the restaurants of every shard in DIRECTORY")
+    args = parser.parse_args()
+
+    if args.shards:
+        # Imported here, sharding itself imports this module
+        from sharding import ShardRouter, sharded_replenishment
+
+        router = ShardRouter(args.shards)
+        schedulers = {}
+        print(f"Replenished {sharded_replenishment(router, schedulers)} restaurant(s)")
+        while not args.once:
+            time.sleep(args.interval)
+            sharded_replenishment(router, schedulers)
+        return
+    with get_connection_pool().cursor() as cursor:
+        print(f"Replenished {replenishment_scheduler.run_due(cursor)} restaurant(s)")
+    if args.once:
+        return
+    replenishment_scheduler.start(get_connection_pool().cursor, args.interval).wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import csv
+import json
+import sqlite3
+import time
+
+from restaurant_data_dump import initialize_db, insert_restaurants, restaurant_row, validate_restaurant_data
+
+default_batch_size = 5000
+
+
+def read_records(path):
+    # Streams one record at a time, so memory stays flat whatever the file size.
+    # JSON lines are yielded undecoded, a malformed line is rejected like any other bad record
+    with open(path, newline="", encoding="utf-8") as source:
+        if path.endswith(".csv"):
+            for line_number, record in enumerate(csv.DictReader(source), start=2):
+                yield line_number, record
+        else:
+            for line_number, line in enumerate(source, start=1):
+                if line.strip():
+                    yield line_number, line.rstrip("\r\n")
+
+
+def optional_float(value):
+    # Missing, null and empty CSV cells all mean not given
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    return float(value)
+
+
+def parse_record(record: dict):
+    location = record["location"]
+    if isinstance(location, str):
+        location = location.split(",")
+    if not all(isinstance(l, str) for l in location):
+        raise ValueError("location entries must be strings")
+    return {
+        "restaurant_id": int(record["restaurant_id"]),
+        "name": str(record["name"]).strip(),
+        "location": set(l.strip() for l in location if l.strip()),
+        "num_of_bags": int(record["num_of_bags"]),
+        "remaining_bags": int(record["remaining_bags"]),
+        "overall_rating": float(record["overall_rating"]),
+        "opening_time": str(record["opening_time"]).strip(),
+        "closing_time": str(record["closing_time"]).strip(),
+        "latitude": optional_float(record.get("latitude")),
+        "longitude": optional_float(record.get("longitude"))
+    }
+
+
+def write_reject(rejects, line_number, record, errors):
+    rejects.write(json.dumps({"line": line_number, "record": record, "errors": errors}) + "\n")
+
+
+def flush_batch(conn, batch, rejects):
+    # batch holds (line_number, record, row); returns how many rows were inserted
+    cursor = conn.cursor()
+    try:
+        insert_restaurants(cursor, [row for _, _, row in batch])
+        conn.commit()
+        return len(batch)
+    except sqlite3.IntegrityError:
+        conn.rollback()
+
+    # A duplicate id somewhere in the batch, retry row by row so only the offending records are rejected
+    inserted = 0
+    for line_number, record, row in batch:
+        try:
+            cursor.execute("SAVEPOINT bulk_row")
+            insert_restaurants(cursor, [row])
+            cursor.execute("RELEASE bulk_row")
+            inserted += 1
+        except sqlite3.IntegrityError as error:
+            cursor.execute("ROLLBACK TO bulk_row")
+            cursor.execute("RELEASE bulk_row")
+            write_reject(rejects, line_number, record, [f"Restaurant ID already exists ({error})"])
+    conn.commit()
+    return inserted
+
+
+def bulk_import_restaurants(path, reject_path, batch_size: int = default_batch_size, conn=None):
+    if conn is None:
+        conn, _ = initialize_db()
+    started = time.perf_counter()
+    inserted = 0
+    rejected = 0
+    batch = []
+
+    with open(reject_path, "w", encoding="utf-8") as rejects:
+        for line_number, record in read_records(path):
+            try:
+                if isinstance(record, str):
+                    # Decoded here, so the reject keeps the record as an object whenever it is valid JSON
+                    record = json.loads(record)
+                data = parse_record(record)
+                errors = validate_restaurant_data(data)
+            except (KeyError, TypeError, ValueError) as error:
+                errors = [f"Invalid record: {error!r}"]
+            if errors:
+                write_reject(rejects, line_number, record, errors)
+                rejected += 1
+                continue
+
+            batch.append((line_number, record, restaurant_row(data)))
+            if len(batch) >= batch_size:
+                flushed = flush_batch(conn, batch, rejects)
+                inserted += flushed
+                rejected += len(batch) - flushed
+                batch = []
+
+        if batch:
+            flushed = flush_batch(conn, batch, rejects)
+            inserted += flushed
+            rejected += len(batch) - flushed
+
+    seconds = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "rejected": rejected,
+        "seconds": seconds,
+        "rowsPerSecond": (inserted + rejected) / seconds if seconds else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load restaurants from a CSV or JSON Lines file")
+    parser.add_argument("path", help="input file, .csv or .jsonl")
+    parser.add_argument("--rejects", default="restaurant_rejects.jsonl", help="where invalid records are written")
+    parser.add_argument("--batch-size", type=int, default=default_batch_size)
+    args = parser.parse_args()
+
+    conn, _ = initialize_db()
+    try:
+        report = bulk_import_restaurants(args.path, args.rejects, args.batch_size, conn)
+    finally:
+        conn.close()
+    print(f"Inserted {report['inserted']} restaurant(s), rejected {report['rejected']} "
+          f"in {report['seconds']:.2f}s ({report['rowsPerSecond']:.0f} rows/sec)")
+    if report["rejected"]:
+        print(f"Rejected records written to {args.rejects}")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,10 +39,7 @@ def update_restaurant_data(data, filename="restaurant_data.xlsx"):
         wb = Workbook()
         ws = wb.active
         ws.title = "Restaurants"
-        ws.append([
-            "ID", "Opening Time", "Closing Time",
-            "Num Bags", "Price per Bag", "Actual Num Bags"
-        ])
+        ws.append(RESTAURANT_DATA_HEADER)
         wb.save(filename)
 
     wb = load_workbook(filename)
@@ -59,6 +56,81 @@ def update_restaurant_data(data, filename="restaurant_data.xlsx"):
 
     print("Restaurant data saved successfully!")
 
+RESTAURANT_DATA_HEADER = [
+    "ID", "Opening Time", "Closing Time",
+    "Num Bags", "Price per Bag", "Actual Num Bags"
+]
+EXCEL_MAX_ROWS_PER_SHEET = 1048575  # Excel's row limit, minus the header
+
+
+def rotated_filename(filename, file_number):
+    base, extension = os.path.splitext(filename)
+    return filename if file_number == 1 else f"{base}_{file_number}{extension}"
+
+
+def export_restaurant_data(records, filename=None, max_rows_per_sheet=EXCEL_MAX_ROWS_PER_SHEET,
+                           max_sheets_per_file=1, overwrite=False):
+    # Writes all records in a single pass with a write-only workbook, instead of
+    # reloading and resaving the whole file per row like update_restaurant_data.
+    # Rotates to a new sheet after max_rows_per_sheet rows, and to a new file
+    # (restaurant_export_..._2.xlsx, ...) after max_sheets_per_file sheets.
+    # A write-only save replaces the file, so the default name is dated rather than
+    # update_restaurant_data's, and an existing export is only replaced when asked to.
+    if filename is None:
+        filename = datetime.now().strftime("restaurant_export_%Y%m%d_%H%M%S.xlsx")
+    if os.path.exists(filename) and not overwrite:
+        raise ValueError(f"{filename} already exists, pass overwrite=True to replace it")
+    written_files = []
+    wb = None
+    ws = None
+    sheets_in_file = 0
+    rows_in_sheet = 0
+
+    def next_sheet():
+        nonlocal wb, ws, sheets_in_file, rows_in_sheet
+        if wb is None or sheets_in_file >= max_sheets_per_file:
+            if wb is not None:
+                wb.save(written_files[-1])
+            wb = Workbook(write_only=True)
+            sheets_in_file = 0
+            written_files.append(rotated_filename(filename, len(written_files) + 1))
+        sheets_in_file += 1
+        ws = wb.create_sheet("Restaurants" if sheets_in_file == 1 else f"Restaurants {sheets_in_file}")
+        ws.append(RESTAURANT_DATA_HEADER)
+        rows_in_sheet = 0
+
+    skipped = 0
+    for data in records:
+        if not validate_data(data):
+            skipped += 1
+            continue
+        if ws is None or rows_in_sheet >= max_rows_per_sheet:
+            next_sheet()
+        ws.append([
+            data["id"],
+            data["openingTime"],
+            data["closingTime"],
+            data["numBags"],
+            data["pricePerBag"],
+            data["actualNumBags"]
+        ])
+        rows_in_sheet += 1
+
+    if wb is None:
+        next_sheet()
+    wb.save(written_files[-1])
+
+    # Files rotated to by an earlier, larger export would otherwise read as part of this one
+    file_number = len(written_files) + 1
+    while os.path.exists(rotated_filename(filename, file_number)):
+        os.remove(rotated_filename(filename, file_number))
+        file_number += 1
+
+    if skipped:
+        print(f"{skipped} invalid record(s) were NOT saved.")
+    print(f"Restaurant data exported to {', '.join(written_files)}")
+    return written_files
+
 def get_restaurant_input():
     print("\n--- Enter Restaurant Data ---")
 
@@ -84,25 +156,13 @@ if __name__ == "__main__":
 import sqlite3
 from datetime import datetime
 import json
+from catalog_cache import invalidate_catalog, invalidate_restaurant
+from migrations import connect
 
 def initialize_db():
-    conn = sqlite3.connect("tgtg.db")
+    # Same database and schema as the rest of the backend, RESTAURANT is the table written below
+    conn = connect()
     cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS Restaurant (
-            restaurant_id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            location TEXT NOT NULL,
-            num_of_bags INTEGER NOT NULL,
-            remaining_bags INTEGER NOT NULL,
-            overall_rating REAL NOT NULL,
-            opening_time TEXT NOT NULL,
-            closing_time TEXT NOT NULL
-        )
-    """)
-    
-    conn.commit()
     return conn, cursor
 
 def validate_time(time_str):
@@ -143,15 +203,27 @@ def validate_restaurant_data(data):
         if (closing - opening).total_seconds() <= 0:
             errors.append("Closing time must be after opening time.")
 
+    # Optional, but a restaurant without both is not found by the nearest restaurants strategy
+    latitude = data.get("latitude")
+    longitude = data.get("longitude")
+    if (latitude is None) != (longitude is None):
+        errors.append("Latitude and longitude must be given together.")
+    if latitude is not None and not -90 <= latitude <= 90:
+        errors.append("Latitude must be between -90 and 90.")
+    if longitude is not None and not -180 <= longitude <= 180:
+        errors.append("Longitude must be between -180 and 180.")
+
     return errors
 
-def insert_restaurant(cursor, data):
-    cursor.execute("""
-        INSERT INTO Restaurant
-        (restaurant_id, name, location, num_of_bags, remaining_bags,
-        overall_rating, opening_time, closing_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+INSERT_RESTAURANT_SQL = """
+    INSERT INTO RESTAURANT
+    (restaurant_id, name, location, num_of_bags, remaining_bags,
+    overall_rating, opening_time, closing_time, latitude, longitude)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def restaurant_row(data):
+    return (
         data["restaurant_id"],
         data["name"],
         json.dumps(list(data["location"])),
@@ -159,8 +231,18 @@ def insert_restaurant(cursor, data):
         data["remaining_bags"],
         data["overall_rating"],
         data["opening_time"],
-        data["closing_time"]
-    ))
+        data["closing_time"],
+        data.get("latitude"),
+        data.get("longitude")
+    )
+
+def insert_restaurant(cursor, data):
+    cursor.execute(INSERT_RESTAURANT_SQL, restaurant_row(data))
+    invalidate_restaurant(data["restaurant_id"], data["location"])
+
+def insert_restaurants(cursor, rows):
+    cursor.executemany(INSERT_RESTAURANT_SQL, rows)
+    invalidate_catalog()
 
 def main():
     conn, cursor = initialize_db()
@@ -176,6 +258,11 @@ def main():
         "opening_time": input("Opening Time (HH:MM AM/PM): ").strip(),
         "closing_time": input("Closing Time (HH:MM AM/PM): ").strip()
     }
+    latitude = input("Latitude (optional): ").strip()
+    longitude = input("Longitude (optional): ").strip()
+    if latitude or longitude:
+        data["latitude"] = float(latitude) if latitude else None
+        data["longitude"] = float(longitude) if longitude else None
     
     errors = validate_restaurant_data(data)
     if errors:
@@ -0,0 +1,78 @@
+import threading
+from abc import ABC, abstractmethod
+
+from catalog_cache import sync_restaurant_changes
+
+max_query_parameters = 500  # below SQLite's bound parameter limit
+
+
+def fetch_in_chunks(cursor, query: str, values, params=()) -> list:
+    # query has one {placeholders} slot for an IN list, values are bound a chunk at a time after params
+    values = list(values)
+    rows = []
+    for start in range(0, len(values), max_query_parameters):
+        chunk = values[start:start + max_query_parameters]
+        placeholders = ", ".join("?" * len(chunk))
+        rows += cursor.execute(query.format(placeholders=placeholders), (*params, *chunk)).fetchall()
+    return rows
+
+
+class RestaurantIndex(ABC):
+    # In-memory state derived from RESTAURANT, loaded once and then re-read only for the restaurants written since.
+    # Register invalidate() with add_invalidation_listener; refresh() also picks up other processes' writes
+    def __init__(self):
+        self._loaded = False
+        self._dirty = set()
+        self._lock = threading.RLock()  # guards the index itself
+        # Guards _loaded and _dirty only; never held while calling out, so invalidate() cannot wait on a reader
+        self._dirty_lock = threading.Lock()
+
+    @abstractmethod
+    def _clear(self):
+        pass
+
+    @abstractmethod
+    def _load(self, cursor, restaurant_ids=None):
+        # restaurant_ids None loads everything; ids without a row any more are simply not put back
+        pass
+
+    @abstractmethod
+    def _remove(self, restaurant_id):
+        pass
+
+    def invalidate(self, restaurant_id=None):
+        # Only marks work, the next refresh (which has a cursor) applies it
+        with self._dirty_lock:
+            if restaurant_id is None:
+                self._loaded = False
+                self._dirty.clear()
+            elif self._loaded:
+                self._dirty.add(restaurant_id)
+
+    def refresh(self, cursor):
+        # Writes committed elsewhere come back through invalidate() like this process's own.
+        # Synced before taking the lock, the sync calls every index's invalidate()
+        sync_restaurant_changes(cursor)
+        with self._lock:
+            self._apply_changes(cursor)
+
+    def _apply_changes(self, cursor):
+        # Caller holds self._lock
+        with self._dirty_lock:
+            loaded, dirty = self._loaded, self._dirty
+            self._loaded, self._dirty = True, set()
+        try:
+            if not loaded:
+                self._clear()
+                self._load(cursor)
+                return
+            for restaurant_id in dirty:
+                self._remove(restaurant_id)
+            if dirty:
+                self._load(cursor, list(dirty))
+        except BaseException:
+            # Left to the next refresh
+            with self._dirty_lock:
+                self._loaded = self._loaded and loaded
+                self._dirty |= dirty
+            raise
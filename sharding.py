@@ -0,0 +1,341 @@
+import heapq
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from CustomerInquiryAndDataModels import (
+    RestaurantResponse,
+    _on_connect,
+    add_customer_location_if_not_exists,
+    create_schema,
+    get_connection_pool,
+    get_user,
+    inquiry_open_at,
+    load_restaurants_by_location,
+    simplex_rating_threshold,
+    validate_input_types,
+    validate_inputs,
+)
+from Customer_Purchase_and_Restaurant_Cancellation import (
+    cancel_customer_order,
+    cancel_restaurant_orders,
+    get_customer,
+    reconcileRestaurantRatings,
+    reserve_bags,
+    send_cancellation_to_customers,
+    updateCustomerRestaurantRating,
+    update_restaurant_remaining_bags,
+)
+from catalog_cache import add_invalidation_listener, invalidate_restaurant
+from connection_pool import ConnectionPool
+from opening_hours import open_intervals
+from purchase_order_repository import customer_order_history, default_page_size, get_purchase_order
+from replenishment import ReplenishmentScheduler
+import instrumentation
+
+# USER, USER_LOCATION, ratings and the shard directory stay in the main database (migrations.database_path);
+# each shard is a full application database holding its restaurants, their orders and their bag ledger
+default_shard_directory = "shards"
+default_shard_pool_size = 2
+
+
+def shard_name(location: str) -> str:
+    # One file per location, "New Cairo" -> shards/new_cairo.db
+    name = re.sub(r"[^0-9a-z]+", "_", location.strip().lower()).strip("_")
+    if not name:
+        raise ValueError(f"Location '{location}' cannot be mapped to a shard")
+    return name
+
+
+class ShardRouter:
+    def __init__(
+            self,
+            directory: str = default_shard_directory,
+            pool_size: int = default_shard_pool_size,
+            location_shards: dict = None
+    ):
+        self.directory = directory
+        self.pool_size = pool_size
+        # Optional location -> shard overrides, e.g. to keep small towns together in one file
+        self.location_shards = dict(location_shards or {})
+        self._pools = {}
+        # restaurant_id -> shard, restaurants never move once placed. Location and shard lists are not cached,
+        # other processes place restaurants too and a read of LOCATION_SHARD is one primary key range
+        self._restaurants = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def shard_for_location(self, location: str) -> str:
+        return self.location_shards.get(location) or shard_name(location)
+
+    def pool(self, shard: str) -> ConnectionPool:
+        pool = self._pools.get(shard)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(shard)
+                if pool is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    pool = self._pools[shard] = ConnectionPool(
+                        os.path.join(self.directory, f"{shard}.db"), self.pool_size,
+                        initializer=create_schema, on_connect=_on_connect
+                    )
+        return pool
+
+    def shards(self) -> list:
+        with get_connection_pool().cursor() as cursor:
+            return [shard for (shard,) in cursor.execute("SELECT DISTINCT SHARD FROM LOCATION_SHARD ORDER BY SHARD")]
+
+    def restaurant_shard(self, restaurant_id) -> str:
+        shard = self._restaurants.get(restaurant_id)
+        if shard is None:
+            with get_connection_pool().cursor() as cursor:
+                row = cursor.execute(
+                    "SELECT SHARD FROM RESTAURANT_SHARD WHERE RESTAURANT_ID = ?", (restaurant_id,)
+                ).fetchone()
+            if row is None:
+                raise ValueError(f"Restaurant '{restaurant_id}' not found")
+            shard = self._restaurants[restaurant_id] = row[0]
+        return shard
+
+    def shards_for_location(self, location: str) -> list:
+        # Usually one: a restaurant also serving a neighbouring city stays in its home shard
+        with get_connection_pool().cursor() as cursor:
+            return [shard for (shard,) in cursor.execute(
+                "SELECT SHARD FROM LOCATION_SHARD WHERE LOCATION = ? ORDER BY SHARD", (location,)
+            )]
+
+    def place_restaurant(self, data: dict) -> str:
+        # Home shard is the first location's (sorted when given as a set, so placement is deterministic)
+        locations = data["location"]
+        locations = sorted(locations) if isinstance(locations, (set, frozenset)) else list(locations)
+        if not locations:
+            raise ValueError("Restaurant needs at least one location")
+        shard = self.shard_for_location(locations[0])
+        restaurant_id = data["restaurant_id"]
+        # The directory row is written first, its primary key keeps restaurant ids unique across shards
+        with get_connection_pool().cursor() as cursor:
+            if cursor.execute("SELECT 1 FROM RESTAURANT_SHARD WHERE RESTAURANT_ID = ?", (restaurant_id,)).fetchone():
+                raise ValueError(f"Restaurant '{restaurant_id}' already exists")
+            cursor.execute("INSERT INTO RESTAURANT_SHARD (RESTAURANT_ID, SHARD) VALUES (?, ?)", (restaurant_id, shard))
+            cursor.executemany(
+                "INSERT OR IGNORE INTO LOCATION_SHARD (LOCATION, SHARD) VALUES (?, ?)",
+                [(location, shard) for location in locations]
+            )
+            try:
+                with self.pool(shard).cursor() as shard_cursor:
+                    shard_cursor.execute("""
+                    INSERT INTO RESTAURANT
+                    (
+                        RESTAURANT_ID, NAME, LOCATION, NUM_OF_BAGS, REMAINING_BAGS, OVERALL_RATING,
+                        OPENING_TIME, CLOSING_TIME, LATITUDE, LONGITUDE
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (
+                        restaurant_id, data["name"], json.dumps(locations), data["num_of_bags"],
+                        data["remaining_bags"], data["overall_rating"], data["opening_time"], data["closing_time"],
+                        data.get("latitude"), data.get("longitude")
+                    ))
+            except BaseException:
+                cursor.connection.rollback()
+                raise
+        with self._lock:
+            self._restaurants[restaurant_id] = shard
+        invalidate_restaurant(restaurant_id, locations)
+        return shard
+
+    def scatter(self, func, shards=None) -> dict:
+        # func(cursor) on every shard in parallel, shard -> result
+        shards = self.shards() if shards is None else list(shards)
+        if len(shards) <= 1:
+            results = {}
+            for shard in shards:
+                with self.pool(shard).cursor() as cursor:
+                    results[shard] = func(cursor)
+            return results
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix="foodbags-shard")
+
+        def run(shard):
+            with self.pool(shard).cursor() as cursor:
+                return func(cursor)
+
+        futures = {shard: self._executor.submit(run, shard) for shard in shards}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+def find_purchase_order_shard(router: ShardRouter, order_id: int) -> str:
+    # Order ids carry no shard, one primary key lookup per shard finds it
+    found = router.scatter(lambda cursor: get_purchase_order(cursor, order_id) is not None)
+    for shard, exists in found.items():
+        if exists:
+            return shard
+    raise ValueError("Purchase order not found")
+
+
+def sharded_customer_inquiry(router: ShardRouter, input_data: dict):
+    # Simplex over the shards serving the location; the ranked and nearest indexes are per database
+    with instrumentation.request("customer_inquiry"):
+        with get_connection_pool().cursor() as cursor:
+            with instrumentation.stage("validation"):
+                validate_inputs(cursor, input_data, ["email", "location", "selectionStrategy"])
+            if input_data["selectionStrategy"] != "simplex":
+                raise ValueError(f"Selection strategy '{input_data['selectionStrategy']}' is not supported on shards")
+            with instrumentation.stage("user_lookup"):
+                user = get_user(cursor, input_data["email"])
+            if user is None:
+                raise ValueError(f"User '{input_data['email']}' not subscribed")
+            with instrumentation.stage("location_upsert"):
+                add_customer_location_if_not_exists(cursor, input_data["location"], user.location, user.id)
+        location = input_data["location"]
+        open_at = inquiry_open_at(input_data)
+        with instrumentation.stage("strategy"):
+            found = router.scatter(
+                lambda cursor: load_restaurants_by_location(cursor, location, simplex_rating_threshold),
+                router.shards_for_location(location)
+            )
+        response = list()
+        for shard in sorted(found):
+            for restaurant in found[shard]:
+                if open_at is not None and not any(
+                        start <= open_at < end
+                        for start, end in open_intervals(restaurant.opening_time, restaurant.closing_time)):
+                    continue
+                response.append(RestaurantResponse(restaurant.name, restaurant.remaining_bags).to_api())
+        return response
+
+
+def sharded_customer_purchase(router: ShardRouter, input_data: dict):
+    with instrumentation.request("customer_purchase"):
+        required_fields = ["restaurantId", "numberOfBags", "emailOrPhone", "location"]
+        validate_input_types(input_data, required_fields)
+        # Only the restaurant's shard is write-locked, purchases in other cities commit in parallel
+        with router.pool(router.restaurant_shard(input_data["restaurantId"])).cursor() as cursor:
+            validate_inputs(cursor, input_data, required_fields)
+            with get_connection_pool().cursor() as user_cursor:
+                user = get_customer(user_cursor, input_data["emailOrPhone"])
+                add_customer_location_if_not_exists(user_cursor, input_data["location"], user.location, user.id)
+            purchase_id, remaining_bags = reserve_bags(cursor, user.id, input_data)
+            cursor.connection.commit()
+    invalidate_restaurant(input_data["restaurantId"])
+
+    return {
+        "message": "Purchase successful",
+        "purchaseOrderId": purchase_id,
+        "remainingBags": remaining_bags,
+    }
+
+
+def sharded_restaurant_cancel(router: ShardRouter, input_data: dict):
+    with instrumentation.request("restaurant_cancel"):
+        validate_input_types(input_data, ["restaurantId", "numberOfBags"])
+        with router.pool(router.restaurant_shard(input_data["restaurantId"])).cursor() as cursor:
+            validate_inputs(cursor, input_data, ["restaurantId", "numberOfBags"])
+            with get_connection_pool().cursor() as user_cursor:
+                notifications = cancel_restaurant_orders(cursor, input_data["restaurantId"], user_cursor)
+            remaining_bags = update_restaurant_remaining_bags(
+                cursor, input_data["restaurantId"], input_data["numberOfBags"], "restaurant_cancel"
+            )
+            cursor.connection.commit()
+    invalidate_restaurant(input_data["restaurantId"])
+    send_cancellation_to_customers(notifications)
+
+    return {
+        "message": "Restaurant cancellation processed",
+        "remainingBags": remaining_bags,
+        "canceledOrders": len(notifications),
+    }
+
+
+def sharded_customer_cancel(router: ShardRouter, input_data: dict):
+    with instrumentation.request("customer_cancel"):
+        with get_connection_pool().cursor() as cursor:
+            validate_inputs(cursor, input_data, ["purchaseOrderId", "emailOrPhone"])
+        shard = find_purchase_order_shard(router, input_data["purchaseOrderId"])
+        with router.pool(shard).cursor() as cursor:
+            order, remaining_bags = cancel_customer_order(cursor, input_data["purchaseOrderId"])
+            cursor.connection.commit()
+    invalidate_restaurant(order["restaurantId"])
+
+    return {
+        "message": "Customer cancellation processed",
+        "remainingBags": remaining_bags,
+    }
+
+
+def sharded_customer_order_history(
+        router: ShardRouter, user_id: int, limit: int = default_page_size, after=None, archived: bool = False
+):
+    # Every shard returns its own newest page after the same key, the pages are merged on (ORDERD_AT, PURCHASE_ORDER_ID)
+    pages = router.scatter(lambda cursor: customer_order_history(cursor, user_id, limit, after, archived))
+    merged = heapq.merge(
+        *(page["orders"] for page in pages.values()), key=lambda order: (order.ordered_at, order.id), reverse=True
+    )
+    orders = []
+    for order in merged:
+        if len(orders) == limit:
+            break
+        orders.append(order)
+    more = len(orders) < sum(len(page["orders"]) for page in pages.values()) or any(
+        page["nextPage"] is not None for page in pages.values()
+    )
+    next_page = (orders[-1].ordered_at, orders[-1].id) if more and orders else None
+    return {"orders": orders, "nextPage": next_page}
+
+
+
+def sharded_customer_rating(router: ShardRouter, user_id: int, restaurant_id: int, rating: int):
+    # Ratings and their aggregate stay in the main database, OVERALL_RATING is written in the restaurant's shard
+    with instrumentation.request("customer_rating"):
+        shard = router.restaurant_shard(restaurant_id)
+        with get_connection_pool().cursor() as cursor, router.pool(shard).cursor() as shard_cursor:
+            updateCustomerRestaurantRating(cursor, user_id, restaurant_id, rating, shard_cursor)
+
+
+def sharded_reconcile_ratings(router: ShardRouter, fix: bool = True) -> list:
+    # Repairs the aggregates like reconcile-ratings, then copies every aggregate's rating into the shards.
+    # A shard write committing without its main database one (or the reverse) is caught here too
+    with get_connection_pool().cursor() as cursor:
+        drift = reconcileRestaurantRatings(cursor, fix)
+        if not fix:
+            return drift
+        ratings = {}
+        for restaurant_id, shard, overall_rating in cursor.execute("""
+        SELECT RESTAURANT_SHARD.RESTAURANT_ID, RESTAURANT_SHARD.SHARD,
+        RESTAURANT_RATING_AGGREGATE.RATING_SUM / NULLIF(RESTAURANT_RATING_AGGREGATE.RATING_COUNT, 0)
+        FROM RESTAURANT_SHARD
+        JOIN RESTAURANT_RATING_AGGREGATE ON RESTAURANT_RATING_AGGREGATE.RESTAURANT_ID = RESTAURANT_SHARD.RESTAURANT_ID
+        """):
+            ratings.setdefault(shard, []).append((overall_rating, restaurant_id, overall_rating))
+    for shard, updates in ratings.items():
+        with router.pool(shard).cursor() as shard_cursor:
+            shard_cursor.executemany(
+                "UPDATE RESTAURANT SET OVERALL_RATING = ? WHERE RESTAURANT_ID = ? AND OVERALL_RATING IS NOT ?", updates
+            )
+    return drift
+
+
+def sharded_replenishment(router: ShardRouter, schedulers: dict, clock=datetime.now) -> int:
+    # schedulers is shard -> ReplenishmentScheduler, kept by the caller between runs; each shard keeps its own schedule
+    replenished = 0
+    for shard in router.shards():
+        scheduler = schedulers.get(shard)
+        if scheduler is None:
+            scheduler = schedulers[shard] = ReplenishmentScheduler(clock)
+            add_invalidation_listener(scheduler.invalidate)
+        with router.pool(shard).cursor() as cursor:
+            replenished += scheduler.run_due(cursor)
+    return replenished
@@ -0,0 +1,165 @@
+import heapq
+import math
+
+from restaurant_index import RestaurantIndex, fetch_in_chunks
+
+EARTH_RADIUS_KM = 6371.0088
+default_cell_size_degrees = 0.05  # roughly 5 km cells, a handful of restaurants each in a dense city
+
+
+def haversine_km(latitude_1: float, longitude_1: float, latitude_2: float, longitude_2: float) -> float:
+    phi_1 = math.radians(latitude_1)
+    phi_2 = math.radians(latitude_2)
+    d_phi = phi_2 - phi_1
+    d_lambda = math.radians(longitude_2 - longitude_1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi_1) * math.cos(phi_2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class RestaurantSpatialIndex(RestaurantIndex):
+    def __init__(self, cell_size_degrees: float = default_cell_size_degrees):
+        super().__init__()
+        self.cell_size_degrees = cell_size_degrees
+        self._columns = round(360 / cell_size_degrees)  # columns wrap at the antimeridian
+        self._cells = {}  # (row, column) -> set of restaurant ids
+        self._points = {}  # restaurant id -> (latitude, longitude, cell)
+        self._extent = None  # (min row, max row, min column, max column), recomputed lazily after changes
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float):
+        return math.floor(latitude / self.cell_size_degrees), self._wrap(math.floor(longitude / self.cell_size_degrees))
+
+    def _wrap(self, column):
+        half = self._columns // 2
+        return (column + half) % self._columns - half
+
+    def _put(self, restaurant_id, latitude, longitude):
+        self._remove(restaurant_id)
+        if latitude is None or longitude is None:
+            return
+        cell = self._cell(latitude, longitude)
+        self._points[restaurant_id] = (latitude, longitude, cell)
+        if cell not in self._cells:
+            self._cells[cell] = set()
+            self._extent = None
+        self._cells[cell].add(restaurant_id)
+
+    def _remove(self, restaurant_id):
+        point = self._points.pop(restaurant_id, None)
+        if point is None:
+            return
+        members = self._cells[point[2]]
+        members.discard(restaurant_id)
+        if not members:
+            del self._cells[point[2]]
+            self._extent = None
+
+    def _clear(self):
+        self._cells.clear()
+        self._points.clear()
+        self._extent = None
+
+    def _load(self, cursor, restaurant_ids=None):
+        query = "SELECT RESTAURANT_ID, LATITUDE, LONGITUDE FROM RESTAURANT"
+        if restaurant_ids is None:
+            found = cursor.execute(query).fetchall()
+        else:
+            found = fetch_in_chunks(cursor, query + " WHERE RESTAURANT_ID IN ({placeholders})", restaurant_ids)
+        for restaurant_id, latitude, longitude in found:
+            self._put(restaurant_id, latitude, longitude)
+
+    def _ring(self, center, radius):
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+        for d_column in range(-radius, radius + 1):
+            yield row - radius, self._wrap(column + d_column)
+            yield row + radius, self._wrap(column + d_column)
+        for d_row in range(-radius + 1, radius):
+            yield row + d_row, self._wrap(column - radius)
+            yield row + d_row, self._wrap(column + radius)
+
+    def _rings(self, center, max_radius):
+        # (radius, cells) outwards from center. Once the rings would have covered more cells than are occupied,
+        # the occupied cells are grouped by ring instead, so a query far from the data skips the empty rings
+        for radius in range(max_radius + 1):
+            if (2 * radius + 1) ** 2 > len(self._cells):
+                break
+            yield radius, self._ring(center, radius)
+        else:
+            return
+        rings = {}
+        for cell in self._cells:
+            column_distance = abs(cell[1] - center[1])
+            ring = max(abs(cell[0] - center[0]), min(column_distance, self._columns - column_distance))
+            if ring >= radius:
+                rings.setdefault(ring, []).append(cell)
+        for ring in sorted(rings):
+            yield ring, rings[ring]
+
+    def _ring_lower_bound_km(self, latitude, radius):
+        # Any restaurant more than `radius` whole cells away is at least this far away
+        span = radius * self.cell_size_degrees
+        latitude_bound = math.radians(span) * EARTH_RADIUS_KM
+        highest_latitude = min(89.999, abs(latitude) + span)
+        longitude_bound = haversine_km(highest_latitude, 0.0, highest_latitude, min(span, 180.0))
+        return min(latitude_bound, longitude_bound)
+
+    def nearest(self, latitude: float, longitude: float, k: int, accept=None, max_distance_km: float = None):
+        # Expanding ring search over grid cells, returns [(distance_km, restaurant_id)] closest first.
+        # The lock is only held while a ring is read, accept (I/O, other indexes) runs in between
+        if k <= 0:
+            return []
+        with self._lock:
+            if not self._cells:
+                return []
+            if self._extent is None:
+                rows = [cell[0] for cell in self._cells]
+                columns = [cell[1] for cell in self._cells]
+                self._extent = (min(rows), max(rows), min(columns), max(columns))
+            center = self._cell(latitude, longitude)
+            min_row, max_row, min_column, max_column = self._extent
+            max_radius = max(
+                abs(center[0] - min_row), abs(center[0] - max_row),
+                abs(center[1] - min_column), abs(center[1] - max_column)
+            )
+            rings = self._rings(center, max_radius)
+
+        best = []  # max-heap of (-distance, restaurant_id), holds the k closest accepted so far
+        while True:
+            with self._lock:
+                ring = next(rings, None)
+                if ring is None:
+                    break
+                radius, cells = ring
+                if radius > 1:
+                    # The query point can sit on the edge of its cell, so ring r is only (r - 1) cells away
+                    bound = self._ring_lower_bound_km(latitude, radius - 1)
+                    if max_distance_km is not None and bound > max_distance_km:
+                        break
+                    if len(best) == k and -best[0][0] <= bound:
+                        break
+                candidates = []
+                for cell in cells:
+                    for restaurant_id in self._cells.get(cell, ()):
+                        point = self._points[restaurant_id]
+                        distance = haversine_km(latitude, longitude, point[0], point[1])
+                        if max_distance_km is not None and distance > max_distance_km:
+                            continue
+                        if len(best) == k and distance >= -best[0][0]:
+                            continue
+                        candidates.append((distance, restaurant_id))
+            for distance, restaurant_id in sorted(candidates):
+                # Closest first, accept is not asked about candidates that can no longer make the k closest
+                if len(best) == k and distance >= -best[0][0]:
+                    break
+                if accept is not None and not accept(restaurant_id):
+                    continue
+                if len(best) == k:
+                    heapq.heapreplace(best, (-distance, restaurant_id))
+                else:
+                    heapq.heappush(best, (-distance, restaurant_id))
+        return sorted((-distance, restaurant_id) for distance, restaurant_id in best)
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+import CustomerInquiryAndDataModels as models
+from Customer_Purchase_and_Restaurant_Cancellation import customer_purchase
+from benchmarks.data_generator import generate_data, user_email
+
+threads = 8
+bags = 20
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    database = str(tmp_path / "purchase.db")
+    generate_data(database, users=threads, restaurants=1, locations=1, purchase_orders=0, ratings=0, seed=1)
+    # One connection per purchasing thread, plus the test's own
+    with models.configure_connection_pool(threads + 1, database).cursor() as cursor:
+        cursor.execute("UPDATE RESTAURANT SET REMAINING_BAGS = ? WHERE RESTAURANT_ID = 1", (bags,))
+        cursor.connection.commit()
+        yield cursor
+
+
+def test_concurrent_purchases_do_not_oversell(cursor):
+    attempts_per_thread = bags // threads + 3
+    start = threading.Barrier(threads)
+    sold = []
+    rejected = []
+    failed = []
+
+    def buy(user_id):
+        start.wait()
+        for _ in range(attempts_per_thread):
+            try:
+                sold.append(customer_purchase({
+                    "restaurantId": 1,
+                    "numberOfBags": 1,
+                    "emailOrPhone": user_email(user_id),
+                    "location": "A",
+                })["purchaseOrderId"])
+            except ValueError as error:
+                rejected.append(str(error))
+            except Exception as error:
+                failed.append(error)
+
+    workers = [threading.Thread(target=buy, args=(user_id,)) for user_id in range(1, threads + 1)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert failed == []
+    assert len(sold) == bags
+    assert rejected == ["Not enough remaining bags at restaurant"] * (threads * attempts_per_thread - bags)
+    assert cursor.execute("SELECT REMAINING_BAGS FROM RESTAURANT WHERE RESTAURANT_ID = 1").fetchone()[0] == 0
+    assert cursor.execute("SELECT COUNT(*) FROM PURCHASE_ORDER WHERE RESTAURANT_ID = 1").fetchone()[0] == bags
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import CustomerInquiryAndDataModels as models
+from Customer_Purchase_and_Restaurant_Cancellation import customer_purchase
+from benchmarks.data_generator import generate_data, user_email
+from catalog_cache import add_invalidation_listener
+from replenishment import ReplenishmentScheduler, SimulatedClock
+
+restaurants = 200
+
+
+@pytest.fixture
+def cursor(tmp_path):
+    database = str(tmp_path / "replenishment.db")
+    generate_data(database, users=5, restaurants=restaurants, locations=4, purchase_orders=0, ratings=0, seed=1)
+    with models.configure_connection_pool(2, database).cursor() as cursor:
+        yield cursor
+
+
+def opening_hours(cursor) -> dict:
+    return {
+        restaurant_id: datetime.fromisoformat(opening_time).hour
+        for restaurant_id, opening_time in cursor.execute("SELECT RESTAURANT_ID, OPENING_TIME FROM RESTAURANT")
+    }
+
+
+def sell_out(cursor):
+    cursor.execute("UPDATE RESTAURANT SET REMAINING_BAGS = 0")
+    cursor.connection.commit()
+
+
+def full_restaurants(cursor) -> set:
+    return {
+        restaurant_id
+        for (restaurant_id,) in cursor.execute("SELECT RESTAURANT_ID FROM RESTAURANT WHERE REMAINING_BAGS = NUM_OF_BAGS")
+    }
+
+
+def test_replenishes_at_opening_time(cursor):
+    # The generator opens restaurants between 06:00 and 12:00
+    clock = SimulatedClock(datetime(2026, 3, 1, 5, 0))
+    scheduler = ReplenishmentScheduler(clock)
+    assert scheduler.run_due(cursor) == 0
+
+    sell_out(cursor)
+    clock.advance(timedelta(hours=4))
+    opened = {restaurant_id for restaurant_id, hour in opening_hours(cursor).items() if hour <= 9}
+    assert scheduler.run_due(cursor) == len(opened)
+    assert full_restaurants(cursor) == opened
+    assert scheduler.run_due(cursor) == 0
+
+
+def test_catches_up_once_after_downtime(cursor):
+    clock = SimulatedClock(datetime(2026, 3, 1, 5, 0))
+    assert ReplenishmentScheduler(clock).run_due(cursor) == 0
+
+    sell_out(cursor)
+    last_event = cursor.execute("SELECT COALESCE(MAX(EVENT_ID), 0) FROM BAG_LEDGER").fetchone()[0]
+    clock.advance(timedelta(days=3, hours=1))
+    # A new instance resumes from RESTAURANT_REPLENISHMENT, three missed openings are one restock
+    assert ReplenishmentScheduler(clock).run_due(cursor) == restaurants
+    assert len(full_restaurants(cursor)) == restaurants
+    assert cursor.execute(
+        "SELECT COUNT(*) FROM BAG_LEDGER WHERE EVENT_ID > ? AND REASON = 'replenish'", (last_event,)
+    ).fetchone()[0] == restaurants
+
+
+def test_purchases_do_not_grow_the_heap(cursor):
+    clock = SimulatedClock(datetime(2026, 3, 1, 5, 0))
+    scheduler = ReplenishmentScheduler(clock)
+    add_invalidation_listener(scheduler.invalidate)
+    scheduler.run_due(cursor)
+    heap_size = len(scheduler._heap)
+
+    for purchase in range(500):
+        customer_purchase({
+            "restaurantId": purchase % restaurants + 1,
+            "numberOfBags": 1,
+            "emailOrPhone": user_email(1),
+            "location": "A",
+        })
+        if purchase % 50 == 0:
+            scheduler.run_due(cursor)
+    scheduler.run_due(cursor)
+    assert len(scheduler._heap) == heap_size
+
+    # Moving an opening pushes one entry, the old one is skipped as stale when it comes up
+    cursor.execute("UPDATE RESTAURANT SET OPENING_TIME = '2026-03-01T05:30:00' WHERE RESTAURANT_ID = 1")
+    cursor.connection.commit()
+    assert scheduler.run_due(cursor) == 0
+    assert len(scheduler._heap) == heap_size + 1
+    clock.advance(timedelta(minutes=45))
+    assert scheduler.run_due(cursor) == 1
+    clock.advance(timedelta(hours=8))
+    assert scheduler.run_due(cursor) == restaurants - 1
+    assert len(scheduler._heap) == heap_size
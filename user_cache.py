@@ -0,0 +1,45 @@
+from functools import lru_cache
+
+import email_validator
+from email_validator import EmailNotValidError, EmailSyntaxError, validate_email
+
+from catalog_cache import CatalogCache
+
+default_user_entries = 10000
+default_validated_emails = 65536
+
+# Normalized email -> User; only found users are cached, a miss always goes back to USER_EMAIL_INDEX.
+# Other processes writing USER are seen once the entry's TTL runs out
+user_catalog = CatalogCache(max_entries=default_user_entries)
+
+
+def user_tag(user_id):
+    return "user", user_id
+
+
+@lru_cache(maxsize=default_validated_emails)
+def _normalize_email(email: str, check_deliverability: bool):
+    try:
+        return validate_email(email, check_deliverability=check_deliverability).normalized
+    except EmailSyntaxError:
+        # Malformed stays malformed; deliverability failures raise instead, so they are not memoized
+        return None
+
+
+def normalize_email(email: str) -> str:
+    # Memoized per address (and deliverability setting), repeat customers skip parsing and DNS
+    try:
+        normalized = _normalize_email(email, email_validator.CHECK_DELIVERABILITY)
+    except (EmailNotValidError, TypeError):
+        normalized = None
+    if normalized is None:
+        raise ValueError(f"Email '{email}' is not a valid email")
+    return normalized
+
+
+def invalidate_user(user_id=None):
+    # Call after writing USER rows; None drops every cached user, e.g. for bulk loads or another database
+    if user_id is None:
+        user_catalog.clear()
+    else:
+        user_catalog.invalidate(user_tag(user_id))